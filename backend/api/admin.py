@@ -1,9 +1,10 @@
 from django.contrib import admin
-from .models import MyUser, Post, Like, Comment
+from .models import MyUser, Post, Like, Comment, Recipe
 
 admin.site.register(MyUser)
 admin.site.register(Post)
 admin.site.register(Like)
 admin.site.register(Comment)
+admin.site.register(Recipe)
 
 # Register your models here.
@@ -0,0 +1,222 @@
+"""
+Async (ASGI) versions of the read endpoints, served under /api/async/.
+
+They return the same payloads as their counterparts in api/views.py but use
+Django's async ORM and cache APIs, so under an ASGI server a worker keeps
+serving other requests while one waits on the database or a slow client.
+Raw-SQL search lookups have no async API and run in a worker thread.
+
+The live event stream (api/events.py) is here too, as it only works under ASGI.
+"""
+import asyncio
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+
+from .cache import arender_posts, arender_profile
+from .conditional import aposts_conditional, aprofile_conditional
+from .events import author_channel, get_broker, user_channel
+from .explore import aexplore_page
+from .follows import afollowed_usernames
+from .models import MyUser, Post
+from .pagination import apaginate_queryset, get_page_size, InvalidCursor
+from .recipes import search_recipe_ids
+from .routers import read_replica
+from .serializers import MyUserProfileSerializer
+from .timeline import get_timeline_page
+from .user_search import search_usernames
+
+
+def _authenticate(request):
+    for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authenticator().authenticate(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+def async_api_view(view):
+    """
+    The parts of DRF's @api_view(['GET']) + IsAuthenticated the async views
+    need: authentication with the configured classes, request.query_params
+    and the same error responses.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        try:
+            user = await sync_to_async(_authenticate)(request)
+        except AuthenticationFailed as e:
+            # Same body DRF's exception handler would produce
+            detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            return JsonResponse(detail, status=401)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        request.user = user
+        # The shared pagination helpers read DRF-style query params
+        request.query_params = request.GET
+        try:
+            return await view(request, *args, **kwargs)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
+    return wrapper
+
+
+def _page_number(request):
+    try:
+        return max(1, int(request.query_params.get('page', 1)))
+    except ValueError:
+        return 1
+
+
+@async_api_view
+@read_replica
+async def get_feed(request):
+    if settings.TIMELINE_FANOUT:
+        post_ids, next_cursor = await sync_to_async(get_timeline_page)(request.user, request)
+    else:
+        following = request.user.following.all()
+        posts = Post.objects.filter(
+            Q(user__in=following) | Q(user=request.user)
+        ).only('id', 'created_at')
+        posts, next_cursor = await apaginate_queryset(posts, request)
+        post_ids = [post.id for post in posts]
+
+    not_modified, headers, states = await aposts_conditional(request, post_ids)
+    if not_modified:
+        return not_modified
+    data = {'results': await arender_posts(post_ids, request, states), 'next_cursor': next_cursor}
+    return JsonResponse(data, headers=headers)
+
+
+@async_api_view
+@read_replica
+async def explore(request):
+    post_ids, next_cursor = await aexplore_page(request)
+
+    not_modified, headers, states = await aposts_conditional(request, post_ids)
+    if not_modified:
+        return not_modified
+    data = {'results': await arender_posts(post_ids, request, states), 'next_cursor': next_cursor}
+    return JsonResponse(data, headers=headers)
+
+
+@async_api_view
+@read_replica
+async def get_user_posts(request, username):
+    if not await MyUser.objects.filter(username=username).aexists():
+        return JsonResponse({'detail': 'No MyUser matches the given query.'}, status=404)
+    post_ids = Post.objects.filter(user=username).order_by('-created_at').values_list('id', flat=True)
+    post_ids = [post_id async for post_id in post_ids]
+    not_modified, headers, states = await aposts_conditional(request, post_ids)
+    if not_modified:
+        return not_modified
+    return JsonResponse(await arender_posts(post_ids, request, states), safe=False, headers=headers)
+
+
+@async_api_view
+@read_replica
+async def get_user_profile_data(request, pk):
+    not_modified, headers, state = await aprofile_conditional(request, pk)
+    if not_modified:
+        return not_modified
+    data = await arender_profile(pk, request, state=state)
+    if data is None:
+        return JsonResponse({'error': 'user does not exist'}, status=404)
+    return JsonResponse(data, headers=headers)
+
+
+@async_api_view
+@read_replica
+async def search_users(request):
+    query = request.query_params.get('query', '')
+    if not query:
+        return JsonResponse({'results': [], 'next_cursor': None})
+
+    page_size = get_page_size(request, default=10, maximum=50)
+    try:
+        usernames, next_cursor = await sync_to_async(search_usernames)(
+            query, limit=page_size, cursor=request.query_params.get('cursor'), exclude=request.user.username,
+        )
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    users = await MyUser.objects.ain_bulk(usernames)
+    users = [users[username] for username in usernames if username in users]
+    following = await afollowed_usernames(request.user, usernames)
+    serializer = MyUserProfileSerializer(users, many=True, context={'request': request, 'following': following})
+    return JsonResponse({'results': serializer.data, 'next_cursor': next_cursor})
+
+
+@async_api_view
+@read_replica
+async def search_recipes(request):
+    query = request.query_params.get('query', '')
+    if not query:
+        return JsonResponse({'results': [], 'next_page': None})
+
+    page = _page_number(request)
+    page_size = get_page_size(request, default=10, maximum=50)
+    ids = await sync_to_async(search_recipe_ids)(query, limit=page_size + 1, offset=(page - 1) * page_size)
+    next_page = page + 1 if len(ids) > page_size else None
+    return JsonResponse({'results': await arender_posts(ids[:page_size], request), 'next_page': next_page})
+
+
+@async_api_view
+async def event_stream(request):
+    """
+    Server-Sent Events carrying the live deltas (see api/events.py) for the
+    viewer's own posts and follows and for everyone they follow
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would tie up a worker for its whole life
+        return JsonResponse({'error': 'The event stream needs an ASGI server'}, status=501)
+    broker = get_broker()
+    if broker is None:
+        return JsonResponse({'error': 'Live events are disabled'}, status=503)
+
+    username = request.user.username
+    following = [name async for name in request.user.following.values_list('username', flat=True)]
+
+    async def stream():
+        subscription = broker.subscription()
+        try:
+            await subscription.subscribe(
+                user_channel(username), author_channel(username), *map(author_channel, following),
+            )
+            yield 'retry: 5000\n\n'
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.EVENT_STREAM_MAX_AGE
+            while (remaining := deadline - loop.time()) > 0:
+                message = await subscription.get(min(settings.EVENT_STREAM_HEARTBEAT, remaining))
+                if message is None:
+                    yield ': ping\n\n'
+                    continue
+                event = json.loads(message)
+                # A follow changes which authors this stream should carry
+                if event['type'] == 'follow' and event['follower'] == username:
+                    channel = author_channel(event['followee'])
+                    if event['following']:
+                        await subscription.subscribe(channel)
+                    else:
+                        await subscription.unsubscribe(channel)
+                yield f'data: {message}\n\n'
+        finally:
+            await subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
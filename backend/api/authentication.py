@@ -0,0 +1,61 @@
+"""
+JWT authentication without a user query on every request.
+
+simplejwt's JWTAuthentication loads the whole MyUser row for each request.
+CachedJWTAuthentication caches just the fields authentication needs for
+AUTH_USER_CACHE_TIMEOUT seconds and rebuilds request.user from them with
+every other field deferred, so a view that does read e.g. request.user.bio
+still gets it, loaded on access. Saving or deleting a user drops its entry
+(see signals.py); an update() that deactivates users takes effect once the
+entry expires.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import MyUser
+
+CACHED_FIELDS = ('username', 'is_active')
+
+
+def auth_user_key(username):
+    return f'auth-user:{username}'
+
+
+def invalidate_auth_users(*usernames):
+    cache.delete_many([auth_user_key(username) for username in usernames])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which we don't cache
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = auth_user_key(user_id)
+        values = cache.get(key)
+        if values is None:
+            values = (
+                MyUser.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .values(*CACHED_FIELDS)
+                .first()
+            )
+            if values is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(key, values, timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+
+        # from_db() takes the loaded values in model field order
+        fields = [field.attname for field in MyUser._meta.concrete_fields if field.attname in values]
+        user = MyUser.from_db(DEFAULT_DB_ALIAS, fields, [values[field] for field in fields])
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
@@ -0,0 +1,180 @@
+"""
+POST /api/batch/ applies a list of likes, comments and follows in one
+transaction, for clients replaying actions queued while offline.
+
+    {"operations": [
+        {"op": "like", "post_id": 12},
+        {"op": "unlike", "post_id": 7},
+        {"op": "comment", "post_id": 12, "text": "Looks great"},
+        {"op": "follow", "username": "alice"},
+        {"op": "unfollow", "username": "bob"}
+    ]}
+
+like/unlike and follow/unfollow set a state rather than toggling, so a batch
+can be replayed safely; when one batch sets the same like or follow twice the
+last operation wins. The response has one result per operation, in order:
+{"status": ...} on success or {"error": ...}. Operations that fail don't stop
+the rest.
+
+Likes and comments are one set-based statement each however many operations
+there are. bulk_create skips model signals, so comments invalidate caches and
+publish their events here, with one counter lookup for the whole batch.
+Follows go row by row through add_follow()/remove_follow(), which report
+whether they changed anything and send the m2m_changed signal that
+user.following.add()/remove() would; counters are then bumped in bulk.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .cache import invalidate_posts
+from .events import author_channel, publish, publishing
+from .follows import add_follow, followed_usernames, remove_follow
+from .likes import apply_likes
+from .models import Comment, MyUser, Post, TimelineEntry
+from .serializers import CommentSerializer
+from .timeline import backfill_timeline, queue_shrunk_authors
+
+MAX_BATCH_OPERATIONS = 100
+
+LIKE_OPS = {'like': True, 'unlike': False}
+FOLLOW_OPS = {'follow': True, 'unfollow': False}
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def _validate(operation):
+    """Returns an error message for a malformed operation, or None"""
+    if not isinstance(operation, dict):
+        return 'Operation must be an object'
+    op = operation.get('op')
+    if op in LIKE_OPS or op == 'comment':
+        post_id = operation.get('post_id')
+        if not isinstance(post_id, int) or isinstance(post_id, bool):
+            return 'post_id must be an integer'
+        if op == 'comment':
+            text = operation.get('text')
+            if not isinstance(text, str) or not text.strip():
+                return 'Comment text cannot be empty'
+    elif op in FOLLOW_OPS:
+        if not isinstance(operation.get('username'), str):
+            return 'username must be a string'
+    else:
+        return f'Unknown op {op!r}'
+    return None
+
+
+def _add_comments(user, comments):
+    """Insert (post_id, text) pairs and bump comments_count. Returns the Comments"""
+    comments = Comment.objects.bulk_create([Comment(user=user, post_id=post_id, text=text) for post_id, text in comments])
+    deltas = Counter(comment.post_id for comment in comments)
+    Post.objects.filter(id__in=deltas).update(comments_count=F('comments_count') + Case(
+        *(When(id=post_id, then=Value(delta)) for post_id, delta in deltas.items()), default=Value(0),
+    ))
+    transaction.on_commit(lambda: _comments_published(comments), robust=True)
+    return comments
+
+
+def _comments_published(comments):
+    invalidate_posts(*{comment.post_id for comment in comments})
+    if not publishing():
+        return
+    posts = Post.objects.filter(id__in={comment.post_id for comment in comments})
+    posts = {post['id']: post for post in posts.values('id', 'user_id', 'likes_count', 'comments_count')}
+    for comment in comments:
+        post = posts.get(comment.post_id)
+        if post is not None:
+            publish(author_channel(post['user_id']), {
+                'type': 'comment',
+                'comment': CommentSerializer(comment).data,
+                'post_id': post['id'],
+                'likes_count': post['likes_count'],
+                'comments_count': post['comments_count'],
+            })
+
+
+def _set_follows(user, followees, wanted):
+    """Make `user` follow (or not) each of `followees` (MyUsers) per `wanted`"""
+    following = followed_usernames(user, wanted)
+    # Only rows this batch actually inserted or deleted count, so a follow
+    # written concurrently is neither double counted nor a unique violation
+    add = [
+        followee for followee in followees
+        if wanted[followee.pk] and followee.pk not in following and add_follow(user, followee)
+    ]
+    remove = [
+        followee.pk for followee in followees
+        if not wanted[followee.pk] and followee.pk in following and remove_follow(user, followee)
+    ]
+
+    MyUser.objects.filter(pk__in=[followee.pk for followee in add]).update(follower_count=F('follower_count') + 1)
+    MyUser.objects.filter(pk__in=remove).update(follower_count=F('follower_count') - 1)
+    MyUser.objects.filter(pk=user.pk).update(following_count=F('following_count') + len(add) - len(remove))
+
+    if settings.TIMELINE_FANOUT:
+        for followee in add:
+            backfill_timeline(user, followee)
+        TimelineEntry.objects.filter(owner=user, post__user__in=remove).delete()
+        queue_shrunk_authors(remove)
+
+
+def apply_batch(user, operations):
+    """Apply `operations` as `user` in one transaction and return their results"""
+    if not isinstance(operations, list):
+        raise InvalidBatch('operations must be a list')
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise InvalidBatch(f'At most {MAX_BATCH_OPERATIONS} operations per request')
+
+    results = [None] * len(operations)
+    valid = []
+    for i, operation in enumerate(operations):
+        error = _validate(operation)
+        if error:
+            results[i] = {'error': error}
+        else:
+            valid.append((i, operation))
+
+    with transaction.atomic():
+        # Taking the user's row first serializes batches from the same user
+        MyUser.objects.select_for_update().filter(pk=user.pk).exists()
+
+        post_ids = set(Post.objects.filter(
+            id__in={operation['post_id'] for _, operation in valid if operation['op'] not in FOLLOW_OPS}
+        ).values_list('id', flat=True))
+        followees = MyUser.objects.in_bulk(
+            {operation['username'] for _, operation in valid if operation['op'] in FOLLOW_OPS}
+        )
+
+        likes, comments, follows = {}, [], {}
+        for i, operation in valid:
+            op = operation['op']
+            if op in FOLLOW_OPS:
+                username = operation['username']
+                if username not in followees:
+                    results[i] = {'error': 'User not found'}
+                elif username == user.pk:
+                    results[i] = {'error': 'You cannot follow yourself'}
+                else:
+                    follows[username] = FOLLOW_OPS[op]
+                    results[i] = {'status': 'followed' if FOLLOW_OPS[op] else 'unfollowed'}
+            elif operation['post_id'] not in post_ids:
+                results[i] = {'error': 'Post not found'}
+            elif op in LIKE_OPS:
+                likes[(user.pk, operation['post_id'])] = LIKE_OPS[op]
+                results[i] = {'status': 'liked' if LIKE_OPS[op] else 'unliked'}
+            else:
+                comments.append((i, operation['post_id'], operation['text'].strip()))
+
+        if likes:
+            apply_likes(likes)
+        if comments:
+            created = _add_comments(user, [(post_id, text) for _, post_id, text in comments])
+            for (i, _, _), comment in zip(comments, created):
+                results[i] = {'status': 'commented', 'comment': CommentSerializer(comment).data}
+        if follows:
+            _set_follows(user, [followees[username] for username in follows], follows)
+    return results
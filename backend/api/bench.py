@@ -0,0 +1,16 @@
+"""Shared helpers for the benchmark management commands"""
+import statistics
+
+
+def percentiles(latencies):
+    """{'p50': …, 'p95': …, 'p99': …} for a list of durations"""
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+    else:
+        cuts = list(latencies) * 99
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def latency_summary(latencies):
+    """'p50 …ms  p95 …ms  p99 …ms' for a list of durations in seconds"""
+    return '  '.join(f"{name} {value * 1000:.1f}ms" for name, value in percentiles(latencies).items())
@@ -0,0 +1,185 @@
+"""
+Cached post and profile payloads.
+
+Fragments are stored without the per-viewer fields (`liked_by_user`,
+`is_following`), so one copy serves every viewer; those are looked up for the
+whole page in one query and overlaid after the cache read. api/signals.py
+drops fragments when the underlying rows change.
+
+The default locmem cache is per process, so another worker's fragment can
+outlive a change made elsewhere. Each fragment records the state it was built
+from (see POST_STATE_FIELDS), and api/conditional.py reads the current state
+for its ETag anyway; given that state, the render functions re-render
+fragments that don't match it, so the body always agrees with the ETag. Other
+reads only see such changes once PAYLOAD_CACHE_TIMEOUT expires; use the file
+or redis CACHE_BACKEND when that matters.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .follows import Follow, is_following
+from .models import MyUser, Post, Like
+from .serializers import MyUserProfileSerializer, PostSerializer
+
+# Bump when the serializers' output or the fragment layout changes so old
+# fragments are ignored
+PAYLOAD_VERSION = 5
+
+# The columns a fragment is built from that can change. A post's state also
+# has its newest comment's id, which catches a preview comment being replaced
+# while the count stays put
+POST_STATE_FIELDS = ('id', 'created_at', 'likes_count', 'comments_count', 'image_status', 'image_width')
+PROFILE_STATE_FIELDS = (
+    'username', 'first_name', 'last_name', 'bio', 'profile_image',
+    'follower_count', 'following_count', 'posts_count',
+)
+
+
+def post_key(post_id):
+    return f'post:{post_id}'
+
+
+def profile_key(username):
+    return f'profile:{username}'
+
+
+def invalidate_posts(*post_ids):
+    cache.delete_many([post_key(post_id) for post_id in post_ids], version=PAYLOAD_VERSION)
+
+
+def invalidate_profiles(*usernames):
+    cache.delete_many([profile_key(username) for username in usernames], version=PAYLOAD_VERSION)
+
+
+def _post_state(post):
+    """The state of a post loaded by for_viewer(), as api/conditional.py reads it"""
+    latest_comment = post.preview_comments[0].id if post.preview_comments else None
+    return (*(getattr(post, field) for field in POST_STATE_FIELDS), latest_comment)
+
+
+def _profile_state(user):
+    # profile_image as its stored name, which is what values_list() returns
+    return tuple(
+        user.profile_image.name if field == 'profile_image' else getattr(user, field)
+        for field in PROFILE_STATE_FIELDS
+    )
+
+
+def _post_fragments(posts, request):
+    """{cache key: (state, payload without liked_by_user)} for already-loaded posts"""
+    posts = list(posts)
+    fragments = {}
+    for post, data in zip(posts, PostSerializer(posts, many=True, context={'request': request}).data):
+        data = dict(data)
+        data.pop('liked_by_user')
+        fragments[post_key(post.id)] = (_post_state(post), data)
+    return fragments
+
+
+def _current(keys, fragments, states):
+    """The cached fragments still matching `states` ({post_id: state}), when given"""
+    if states is None:
+        return fragments
+    return {
+        key: fragments[key]
+        for post_id, key in keys.items()
+        if key in fragments and fragments[key][0] == states.get(post_id)
+    }
+
+
+def _with_liked(post_ids, keys, fragments, liked):
+    # Posts deleted since their id was read are skipped
+    return [
+        {**fragments[keys[post_id]][1], 'liked_by_user': post_id in liked}
+        for post_id in post_ids
+        if keys[post_id] in fragments
+    ]
+
+
+def _profile_fragment(user, request):
+    data = dict(MyUserProfileSerializer(user, context={'request': request, 'following': ()}).data)
+    data.pop('is_following')
+    return _profile_state(user), data
+
+
+def render_posts(post_ids, request, states=None):
+    """
+    Serialized posts for `post_ids`, in that order, with liked_by_user for
+    request.user. `states` is {post_id: state} from posts_conditional();
+    cached fragments built from another state are re-rendered.
+    """
+    post_ids = list(post_ids)
+    keys = {post_id: post_key(post_id) for post_id in post_ids}
+    fragments = _current(keys, cache.get_many(keys.values(), version=PAYLOAD_VERSION), states)
+
+    missing = [post_id for post_id in post_ids if keys[post_id] not in fragments]
+    if missing:
+        fresh = _post_fragments(Post.objects.for_viewer(None).filter(id__in=missing), request)
+        cache.set_many(fresh, timeout=settings.PAYLOAD_CACHE_TIMEOUT, version=PAYLOAD_VERSION)
+        fragments.update(fresh)
+
+    liked = set()
+    if request.user.is_authenticated and post_ids:
+        liked = set(Like.objects.filter(user=request.user, post_id__in=post_ids).values_list('post_id', flat=True))
+    return _with_liked(post_ids, keys, fragments, liked)
+
+
+async def arender_posts(post_ids, request, states=None):
+    """render_posts() for async views"""
+    post_ids = list(post_ids)
+    keys = {post_id: post_key(post_id) for post_id in post_ids}
+    fragments = _current(keys, await cache.aget_many(keys.values(), version=PAYLOAD_VERSION), states)
+
+    missing = [post_id for post_id in post_ids if keys[post_id] not in fragments]
+    if missing:
+        # Everything the serializer touches is prefetched, so it runs without queries
+        posts = [post async for post in Post.objects.for_viewer(None).filter(id__in=missing)]
+        fresh = _post_fragments(posts, request)
+        await cache.aset_many(fresh, timeout=settings.PAYLOAD_CACHE_TIMEOUT, version=PAYLOAD_VERSION)
+        fragments.update(fresh)
+
+    liked = set()
+    if request.user.is_authenticated and post_ids:
+        liked_ids = Like.objects.filter(user=request.user, post_id__in=post_ids).values_list('post_id', flat=True)
+        liked = {post_id async for post_id in liked_ids}
+    return _with_liked(post_ids, keys, fragments, liked)
+
+
+def render_profile(username, request, user=None, state=None):
+    """
+    Serialized profile with is_following for request.user, or None if there is
+    no such user. Pass `user` when the instance is already loaded, and `state`
+    from profile_conditional() to re-render a fragment built from another one.
+    """
+    key = profile_key(username)
+    fragment = cache.get(key, version=PAYLOAD_VERSION)
+    if fragment is None or (state is not None and fragment[0] != state):
+        if user is None:
+            user = MyUser.objects.filter(username=username).first()
+            if user is None:
+                return None
+        fragment = _profile_fragment(user, request)
+        cache.set(key, fragment, timeout=settings.PAYLOAD_CACHE_TIMEOUT, version=PAYLOAD_VERSION)
+
+    following = False
+    if request.user.is_authenticated and request.user.username != username:
+        following = is_following(request.user, username)
+    return {**fragment[1], 'is_following': following}
+
+
+async def arender_profile(username, request, user=None, state=None):
+    """render_profile() for async views"""
+    key = profile_key(username)
+    fragment = await cache.aget(key, version=PAYLOAD_VERSION)
+    if fragment is None or (state is not None and fragment[0] != state):
+        if user is None:
+            user = await MyUser.objects.filter(username=username).afirst()
+            if user is None:
+                return None
+        fragment = _profile_fragment(user, request)
+        await cache.aset(key, fragment, timeout=settings.PAYLOAD_CACHE_TIMEOUT, version=PAYLOAD_VERSION)
+
+    following = False
+    if request.user.is_authenticated and request.user.username != username:
+        following = await Follow.objects.filter(from_myuser=username, to_myuser=request.user.pk).aexists()
+    return {**fragment[1], 'is_following': following}
@@ -0,0 +1,97 @@
+"""
+Conditional GET (ETag) for the feed, explore and profile endpoints.
+
+The ETag hashes the database state the payload is built from: for each post
+on the page its id, created_at, counters, image status, newest comment and
+whether the viewer liked it, in page order; for a profile its fields,
+counters and whether the viewer follows it. That is one indexed query on top
+of the one that picks the page, so a repeat request that ends in a 304 is
+answered without serializing anything, and every worker agrees on it. The
+ETag also covers the viewer and the full URL.
+
+The state is handed on to the render functions in api/cache.py, which
+re-render any cached fragment built from a different state, so a 200 never
+pairs a stale body with the current ETag.
+
+There is no Last-Modified: a page can change without anything on it getting
+newer (after an unfollow, say), so If-Modified-Since can't be answered safely.
+"""
+import hashlib
+
+from django.db.models import Exists, OuterRef, Subquery
+from django.http import HttpResponseNotModified
+from django.utils.cache import get_conditional_response
+
+from .cache import PAYLOAD_VERSION, POST_STATE_FIELDS, PROFILE_STATE_FIELDS
+from .follows import Follow
+from .models import Comment, Like, MyUser, Post
+
+def _post_states(post_ids, viewer):
+    latest_comment = Comment.objects.filter(post=OuterRef('pk')).order_by('-created_at', '-id').values('id')[:1]
+    return Post.objects.filter(id__in=post_ids).annotate(
+        latest_comment=Subquery(latest_comment),
+        viewer_liked=Exists(Like.objects.filter(post=OuterRef('pk'), user=viewer.pk)),
+    ).values_list(*POST_STATE_FIELDS, 'latest_comment', 'viewer_liked')
+
+
+def _profile_states(username, viewer):
+    return MyUser.objects.filter(pk=username).annotate(
+        viewer_follows=Exists(Follow.objects.filter(from_myuser=OuterRef('pk'), to_myuser=viewer.pk)),
+    ).values_list(*PROFILE_STATE_FIELDS, 'viewer_follows')
+
+
+def _ordered(post_ids, states):
+    by_id = {state[0]: state for state in states}
+    return [by_id.get(post_id) for post_id in post_ids]
+
+
+def _conditional(request, state):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((PAYLOAD_VERSION, request.user.pk, request.get_full_path(), state)).encode())
+    etag = f'W/"{digest.hexdigest()}"'
+    # Responses differ per viewer; browsers may keep them but must revalidate
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Authorization'}
+
+    response = get_conditional_response(request, etag=etag)
+    if isinstance(response, HttpResponseNotModified):
+        for header, value in headers.items():
+            response[header] = value
+    return response, headers
+
+
+def _posts_conditional(request, post_ids, states):
+    response, headers = _conditional(request, _ordered(post_ids, states))
+    # Without the viewer's like, which isn't part of the cached fragment
+    return response, headers, {state[0]: state[:-1] for state in states}
+
+
+def _profile_conditional(request, states):
+    response, headers = _conditional(request, states)
+    return response, headers, states[0][:-1] if states else None
+
+
+def posts_conditional(request, post_ids):
+    """
+    Check the request's If-None-Match against the page of `post_ids`.
+    Returns (response, headers, states): response is a 304 when the client's
+    copy is current, else None, headers carry the ETag for the full response
+    and states go to render_posts().
+    """
+    post_ids = list(post_ids)
+    return _posts_conditional(request, post_ids, list(_post_states(post_ids, request.user)))
+
+
+async def aposts_conditional(request, post_ids):
+    """posts_conditional() for async views"""
+    post_ids = list(post_ids)
+    return _posts_conditional(request, post_ids, [state async for state in _post_states(post_ids, request.user)])
+
+
+def profile_conditional(request, username):
+    """posts_conditional() for a profile; the state goes to render_profile()"""
+    return _profile_conditional(request, list(_profile_states(username, request.user)))
+
+
+async def aprofile_conditional(request, username):
+    """profile_conditional() for async views"""
+    return _profile_conditional(request, [state async for state in _profile_states(username, request.user)])
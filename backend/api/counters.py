@@ -0,0 +1,41 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import MyUser, Post, Like, Comment
+
+
+def _count_of(queryset, field):
+    """Correlated COUNT(*) of `queryset` grouped on `field`, 0 when empty"""
+    counts = queryset.order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def post_counter_expressions():
+    return {
+        'likes_count': _count_of(Like.objects.filter(post=OuterRef('pk')), 'post'),
+        'comments_count': _count_of(Comment.objects.filter(post=OuterRef('pk')), 'post'),
+    }
+
+
+def user_counter_expressions():
+    # user.followers.add(x) stores (from_myuser=user, to_myuser=x)
+    follows = MyUser.followers.through.objects
+    return {
+        'follower_count': _count_of(follows.filter(from_myuser=OuterRef('pk')), 'from_myuser'),
+        'following_count': _count_of(follows.filter(to_myuser=OuterRef('pk')), 'to_myuser'),
+        'posts_count': _count_of(Post.objects.filter(user=OuterRef('pk')), 'user'),
+    }
+
+
+def find_drift(model, expressions):
+    """Return {counter name: number of rows whose stored value is wrong}"""
+    annotated = model.objects.annotate(**{f'actual_{name}': expr for name, expr in expressions.items()})
+    return {
+        name: annotated.exclude(**{name: F(f'actual_{name}')}).count()
+        for name in expressions
+    }
+
+
+def repair(model, expressions):
+    """Recompute every counter on `model` in a single UPDATE"""
+    return model.objects.update(**expressions)
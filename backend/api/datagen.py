@@ -0,0 +1,183 @@
+"""
+Synthetic social graph for benchmarks, see `manage.py generate_data`.
+
+Who follows whom is skewed the way real networks are: a user's chance of
+being followed falls off as a power of their popularity rank, so a few
+accounts have most of the followers and the long tail has a handful. Posts
+per user, likes and comments per post are exponentially distributed around
+the requested means, and likes come mostly from the author's followers.
+
+Rows go in with bulk_create, which skips signals and the save() hooks, so the
+side tables (UserSearch, Recipe), the denormalized counters, explore ranks
+and, with TIMELINE_FANOUT, timelines are filled in afterwards.
+"""
+import json
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import post_counter_expressions, repair, user_counter_expressions
+from .explore import update_ranks
+from .follows import Follow
+from .models import Comment, Like, MyUser, Post, Recipe, UserSearch
+from .recipes import parse_recipe
+from .timeline import rebuild_timeline
+
+BATCH_SIZE = 1000
+
+# Exponent of the follow graph's power law: higher means more concentrated
+POPULARITY_EXPONENT = 1.1
+
+FIRST_NAMES = ['Ana', 'Ben', 'Chen', 'Dara', 'Eli', 'Fatima', 'Giulia', 'Hiro', 'Ines', 'Jon', 'Kemi', 'Lars', 'Maya', 'Noor', 'Omar', 'Priya']
+LAST_NAMES = ['Garcia', 'Smith', 'Wang', 'Okafor', 'Rossi', 'Tanaka', 'Silva', 'Novak', 'Khan', 'Muller', 'Dubois', 'Larsen']
+ADJECTIVES = ['Smoky', 'Crispy', 'Lemon', 'Spicy', 'Creamy', 'Garlic', 'Roasted', 'Herby', 'Sticky', 'Golden']
+DISHES = ['Pasta', 'Ramen', 'Tacos', 'Curry', 'Risotto', 'Salad', 'Dumplings', 'Pancakes', 'Shakshuka', 'Stew']
+INGREDIENTS = ['egg', 'flour', 'butter', 'garlic', 'onion', 'tomato', 'rice', 'chicken', 'tofu', 'basil', 'chili', 'lemon', 'cheese', 'noodles']
+UNITS = ['g', 'ml', 'tbsp', 'tsp', 'cup', 'pcs']
+TAGS = ['vegan', 'quick', 'dinner', 'breakfast', 'spicy', 'comfort', 'healthy', 'baking']
+COMMENTS = ['Looks amazing!', 'Making this tonight', 'Yum', 'Saved it', 'What can I use instead of butter?', 'So good', 'Nice plating']
+
+
+def _count(rng, mean, limit):
+    return min(limit, int(rng.expovariate(1 / mean))) if mean > 0 else 0
+
+
+def _caption(rng, title):
+    ingredients = rng.sample(INGREDIENTS, rng.randint(3, 7))
+    return json.dumps({
+        'title': title,
+        'ingredients': [
+            {'id': i, 'name': name, 'quantity': str(rng.randint(1, 500)), 'unit': rng.choice(UNITS)}
+            for i, name in enumerate(ingredients)
+        ],
+        'instructions': '\n'.join(f'Step {i + 1}: add the {name}.' for i, name in enumerate(ingredients)),
+        'tags': rng.sample(TAGS, rng.randint(0, 3)),
+    })
+
+
+def _users(rng, prefix, count):
+    password = make_password('password')
+    users = []
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append(MyUser(
+            username=f'{prefix}{i:06d}', password=password, first_name=first, last_name=last,
+            bio=f'{first} cooks {rng.choice(DISHES).lower()}',
+        ))
+    MyUser.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    UserSearch.objects.bulk_create([
+        UserSearch(user=user, **{field: getattr(user, field).lower() for field in UserSearch.SOURCE_FIELDS})
+        for user in users
+    ], batch_size=BATCH_SIZE)
+    return [user.pk for user in users]
+
+
+def _follows(rng, usernames, mean):
+    """{username: set of usernames they follow}, popular users picked more often"""
+    # Popularity ranks are a random permutation, not the username order
+    popular = rng.sample(usernames, len(usernames))
+    weights, total = [], 0
+    for rank in range(len(popular)):
+        total += 1 / (rank + 1) ** POPULARITY_EXPONENT
+        weights.append(total)
+
+    following = {}
+    for username in usernames:
+        want = _count(rng, mean, len(usernames) - 1)
+        followees = set()
+        # Capped, since drawing distinct users from a skewed distribution slows down near the limit
+        for _ in range(want * 3):
+            if len(followees) >= want:
+                break
+            followee = rng.choices(popular, cum_weights=weights)[0]
+            if followee != username:
+                followees.add(followee)
+        following[username] = followees
+
+    # user.followers.add(x) stores (from_myuser=user, to_myuser=x), i.e. x follows user
+    Follow.objects.bulk_create([
+        Follow(from_myuser_id=followee, to_myuser_id=username)
+        for username, followees in following.items() for followee in followees
+    ], batch_size=BATCH_SIZE)
+    return following
+
+
+def _posts(rng, usernames, mean, days):
+    now = timezone.now()
+    posts = []
+    for username in usernames:
+        for _ in range(_count(rng, mean, 10 * mean)):
+            title = f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}'
+            posts.append(Post(
+                user_id=username,
+                image='post_images/dish.webp',
+                caption=_caption(rng, title),
+                created_at=now - timedelta(seconds=rng.uniform(0, days * 86400)),
+            ))
+    posts = Post.objects.bulk_create(posts, batch_size=BATCH_SIZE)
+    Recipe.objects.bulk_create([Recipe(post=post, **parse_recipe(post.caption)) for post in posts], batch_size=BATCH_SIZE)
+    return posts
+
+
+def _likes_and_comments(rng, posts, usernames, following, likes_per_post, comments_per_post):
+    followers = {}
+    for username, followees in following.items():
+        for followee in followees:
+            followers.setdefault(followee, []).append(username)
+
+    now = timezone.now()
+    likes, comments = [], []
+    for post in posts:
+        fans = followers.get(post.user_id, [])
+        likers = set()
+        for _ in range(_count(rng, likes_per_post, len(usernames))):
+            # Mostly followers, some strangers from explore
+            likers.add(rng.choice(fans) if fans and rng.random() < 0.8 else rng.choice(usernames))
+        age = (now - post.created_at).total_seconds()
+        likes += [Like(user_id=liker, post=post, created_at=post.created_at + timedelta(seconds=rng.uniform(0, age))) for liker in likers]
+        comments += [
+            Comment(
+                user_id=rng.choice(fans) if fans else rng.choice(usernames),
+                post=post,
+                text=rng.choice(COMMENTS),
+                created_at=post.created_at + timedelta(seconds=rng.uniform(0, age)),
+            )
+            for _ in range(_count(rng, comments_per_post, 50 * comments_per_post))
+        ]
+    Like.objects.bulk_create(likes, batch_size=BATCH_SIZE)
+    Comment.objects.bulk_create(comments, batch_size=BATCH_SIZE)
+    return len(likes), len(comments)
+
+
+def generate(users, posts_per_user, follows_per_user, likes_per_post, comments_per_post,
+             days=30, prefix='gen', seed=None):
+    """
+    Create the dataset and bring every derived table up to date.
+    Returns {table: rows created}.
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        usernames = _users(rng, prefix, users)
+        following = _follows(rng, usernames, follows_per_user)
+        posts = _posts(rng, usernames, posts_per_user, days)
+        likes, comments = _likes_and_comments(rng, posts, usernames, following, likes_per_post, comments_per_post)
+
+        repair(Post, post_counter_expressions())
+        repair(MyUser, user_counter_expressions())
+    update_ranks(full=True)
+    if settings.TIMELINE_FANOUT:
+        for user in MyUser.objects.filter(pk__in=usernames).iterator():
+            with transaction.atomic():
+                rebuild_timeline(user)
+
+    return {
+        'users': len(usernames),
+        'follows': sum(len(followees) for followees in following.values()),
+        'posts': len(posts),
+        'likes': likes,
+        'comments': comments,
+    }
@@ -0,0 +1,188 @@
+"""
+Live delta events for likes, comments, new posts and follows.
+
+Writes publish once they commit (see signals.py) and /api/events/ streams
+them to clients as Server-Sent Events. Each stream listens on
+
+    author:<username>  posts by that user, and likes/comments on them
+    user:<username>    follows and unfollows involving that user
+
+for the viewer and everyone they follow. Events carry the new counter values
+rather than the whole post, so clients patch what they already rendered
+instead of re-fetching the feed.
+
+EVENT_BROKER='local' fans out within one process, which is enough when a
+single ASGI worker serves the API. With several processes, point
+EVENT_BROKER='redis' at a shared Redis (or any server speaking its pub/sub
+protocol); that needs the `redis` package.
+"""
+import asyncio
+import functools
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Sent in place of events a client was too slow to take, telling it to re-fetch
+RESYNC = json.dumps({'type': 'resync'})
+
+
+def author_channel(username):
+    return f'author:{username}'
+
+
+def user_channel(username):
+    return f'user:{username}'
+
+
+def publish(channel, event):
+    """Send `event` (a JSON-serializable dict) to everyone listening on `channel`"""
+    broker = get_broker()
+    if broker is not None:
+        broker.publish(channel, json.dumps(event, cls=DjangoJSONEncoder, separators=(',', ':')))
+
+
+def publishing():
+    """
+    Whether a published event could reach anyone, so callers can skip the
+    queries that build one. The local broker only has listeners under ASGI.
+    """
+    broker = get_broker()
+    return broker is not None and broker.has_subscribers()
+
+
+@functools.cache
+def get_broker():
+    if settings.EVENT_BROKER == 'local':
+        return LocalBroker()
+    if settings.EVENT_BROKER == 'redis':
+        return RedisBroker(settings.EVENT_BROKER_URL)
+    if not settings.EVENT_BROKER:
+        return None
+    raise ImproperlyConfigured(f"Unknown EVENT_BROKER {settings.EVENT_BROKER!r}")
+
+
+class LocalBroker:
+    """In-process pub/sub; publish() may be called from any thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._channels.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def has_subscribers(self):
+        return bool(self._channels)
+
+    def subscription(self):
+        return LocalSubscription(self)
+
+    def _add(self, subscription, channels):
+        with self._lock:
+            for channel in channels:
+                self._channels[channel].add(subscription)
+
+    def _remove(self, subscription, channels):
+        with self._lock:
+            for channel in channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+
+class LocalSubscription:
+    """One client's bounded queue, filled from any thread and read on its event loop"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.channels = set()
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENT_QUEUE_SIZE)
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+        self.broker._add(self, channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+        self.broker._remove(self, channels)
+
+    async def get(self, timeout):
+        """The next message, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        await self.unsubscribe(*self.channels)
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The client's loop has shut down; close() will unsubscribe us
+            pass
+
+    def _put(self, message):
+        if self.queue.full():
+            # Rather than silently dropping deltas, make the client start over
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = RESYNC
+        self.queue.put_nowait(message)
+
+
+class RedisBroker:
+    """Pub/sub through Redis, shared by every process pointed at the same server"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("EVENT_BROKER='redis' requires the redis package")
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._client.publish(channel, message)
+
+    def has_subscribers(self):
+        # Listeners may be in other processes
+        return True
+
+    def subscription(self):
+        return RedisSubscription(self.url)
+
+
+class RedisSubscription:
+    def __init__(self, url):
+        import redis.asyncio
+
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+
+    async def subscribe(self, *channels):
+        if channels:
+            await self._pubsub.subscribe(*channels)
+
+    async def unsubscribe(self, *channels):
+        if channels:
+            await self._pubsub.unsubscribe(*channels)
+
+    async def get(self, timeout):
+        message = await self._pubsub.get_message(timeout=timeout)
+        return message['data'].decode() if message else None
+
+    async def close(self):
+        await self._pubsub.aclose()
+        await self._client.aclose()
@@ -0,0 +1,186 @@
+"""
+Ranked explore feed.
+
+A post's worth is its engagement decayed by age,
+
+    (1 + likes + EXPLORE_COMMENT_WEIGHT * comments) * 2 ** -(age_hours / EXPLORE_HALF_LIFE_HOURS)
+
+stored as its log2, which is log2(engagement) + created_hours / half-life
+minus a now / half-life term that is the same for every post. Dropping that
+term keeps the order but makes a score depend only on its own post, so scores
+never need refreshing just because time passed: `manage.py rank_explore`
+only rescores authors whose posts gained or lost likes/comments.
+
+For author diversity an author's k-th best post (counting from 0) is worth
+EXPLORE_AUTHOR_PENALTY ** k as much, i.e. k * log2(penalty) is added to its
+score. Posts older than EXPLORE_WINDOW_DAYS leave the table.
+
+Once the ranked posts run out (a quiet site, or before the first rank run)
+the feed carries on with the newest unranked posts, so it is never empty
+while there are posts at all.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ExploreRank, Post
+from .pagination import (
+    InvalidCursor, apply_cursor, decode_cursor, decode_score_cursor, encode_cursor, get_page_size,
+    paginate_by_score, apaginate_by_score,
+)
+
+BATCH_SIZE = 500
+
+
+def base_score(likes, comments, created_at):
+    engagement = 1 + likes + settings.EXPLORE_COMMENT_WEIGHT * comments
+    return math.log2(engagement) + created_at.timestamp() / 3600 / settings.EXPLORE_HALF_LIFE_HOURS
+
+
+def score_posts(posts):
+    """
+    Field values for ExploreRank rows, from (id, user_id, created_at,
+    likes_count, comments_count) tuples covering all the ranked posts of
+    their authors.
+    """
+    step = math.log2(settings.EXPLORE_AUTHOR_PENALTY)
+    by_author = defaultdict(list)
+    for post_id, author_id, created_at, likes, comments in posts:
+        by_author[author_id].append({
+            'post_id': post_id,
+            'author_id': author_id,
+            'created_at': created_at,
+            'likes_count': likes,
+            'comments_count': comments,
+            'base_score': base_score(likes, comments, created_at),
+        })
+
+    rows = []
+    for author_rows in by_author.values():
+        author_rows.sort(key=lambda row: (row['base_score'], row['post_id']), reverse=True)
+        for k, row in enumerate(author_rows):
+            rows.append({**row, 'score': row['base_score'] + k * step})
+    return rows
+
+
+def _window_start():
+    return timezone.now() - timedelta(days=settings.EXPLORE_WINDOW_DAYS)
+
+
+def _rank_authors(author_ids, since):
+    posts = Post.objects.filter(user__in=author_ids, created_at__gte=since).values_list(
+        'id', 'user_id', 'created_at', 'likes_count', 'comments_count',
+    )
+    rows = [ExploreRank(**row) for row in score_posts(posts)]
+    ExploreRank.objects.bulk_create(
+        rows,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['post'],
+        update_fields=['likes_count', 'comments_count', 'base_score', 'score'],
+    )
+    return len(rows)
+
+
+def update_ranks(full=False):
+    """
+    Bring ExploreRank up to date: drop posts that left the window and rescore
+    every post of each author with a new, changed or dropped post (or of
+    everyone, with `full`). Returns (rescored, expired).
+    """
+    since = _window_start()
+    expired = ExploreRank.objects.filter(created_at__lt=since)
+    authors = set(expired.values_list('author_id', flat=True))
+    expired_count, _ = expired.delete()
+
+    recent = Post.objects.filter(created_at__gte=since)
+    if not full:
+        recent = recent.filter(
+            Q(explore_rank__isnull=True)
+            | ~Q(explore_rank__likes_count=F('likes_count'))
+            | ~Q(explore_rank__comments_count=F('comments_count'))
+        )
+    authors.update(recent.values_list('user_id', flat=True).distinct())
+
+    authors = sorted(authors)
+    rescored = 0
+    for start in range(0, len(authors), BATCH_SIZE):
+        rescored += _rank_authors(authors[start:start + BATCH_SIZE], since)
+
+    return rescored, expired_count
+
+
+def rank_new_post(post):
+    """
+    Put a just-created post into explore straight away. The author's other
+    posts are rescored with it, since their diversity penalties depend on
+    where it lands among them.
+    """
+    _rank_authors([post.user_id], _window_start())
+
+
+def _unranked_cursor(request):
+    """The cursor when paging has moved on to unranked posts, else None"""
+    cursor = request.query_params.get('cursor')
+    if not cursor:
+        return None
+    try:
+        decode_score_cursor(cursor)
+        return None
+    except InvalidCursor:
+        # A (created_at, id) cursor, or InvalidCursor if it is neither
+        decode_cursor(cursor)
+        return cursor
+
+
+def _unranked(cursor, limit):
+    posts = Post.objects.filter(explore_rank__isnull=True)
+    if cursor:
+        posts = apply_cursor(posts, cursor)
+    return posts.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit]
+
+
+def _top_up(post_ids, unranked, page_size):
+    """Fill the rest of a page with `unranked` (one more row than fits, if there is one)"""
+    room = page_size - len(post_ids)
+    next_cursor = None
+    if len(unranked) > room:
+        if room:
+            next_cursor = encode_cursor(*unranked[room - 1])
+        else:
+            # Ranked posts filled the page exactly: start the next one at the newest unranked post
+            created_at, post_id = unranked[0]
+            next_cursor = encode_cursor(created_at, post_id + 1)
+    return post_ids + [post_id for _, post_id in unranked[:room]], next_cursor
+
+
+def explore_page(request):
+    """One page of explore as (post ids, next_cursor): ranked posts, then the newest unranked ones"""
+    page_size = get_page_size(request)
+    cursor = _unranked_cursor(request)
+    post_ids, next_cursor = [], None
+    if cursor is None:
+        ranks, next_cursor = paginate_by_score(ExploreRank.objects.only('post_id', 'score'), request, 'score', 'post_id')
+        post_ids = [rank.post_id for rank in ranks]
+    if next_cursor is None:
+        unranked = list(_unranked(cursor, page_size - len(post_ids) + 1))
+        post_ids, next_cursor = _top_up(post_ids, unranked, page_size)
+    return post_ids, next_cursor
+
+
+async def aexplore_page(request):
+    """explore_page() for async views"""
+    page_size = get_page_size(request)
+    cursor = _unranked_cursor(request)
+    post_ids, next_cursor = [], None
+    if cursor is None:
+        ranks, next_cursor = await apaginate_by_score(ExploreRank.objects.only('post_id', 'score'), request, 'score', 'post_id')
+        post_ids = [rank.post_id for rank in ranks]
+    if next_cursor is None:
+        unranked = [row async for row in _unranked(cursor, page_size - len(post_ids) + 1)]
+        post_ids, next_cursor = _top_up(post_ids, unranked, page_size)
+    return post_ids, next_cursor
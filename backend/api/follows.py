@@ -0,0 +1,79 @@
+"""
+Follow-graph lookups that go straight to the followers through table.
+
+user.followers.add(x) stores a row (from_myuser=user, to_myuser=x), i.e.
+"x follows user". The table's unique (from_myuser, to_myuser) index answers
+single checks and the to_myuser index answers batched ones.
+"""
+from django.db import IntegrityError, router, transaction
+from django.db.models.signals import m2m_changed
+
+from .models import MyUser
+
+Follow = MyUser.followers.through
+
+# Most usernames accepted by one follow-state request
+MAX_FOLLOW_STATE_USERNAMES = 200
+
+
+def is_following(follower, followee):
+    """Does `follower` follow `followee`? Accepts users or usernames."""
+    return Follow.objects.filter(
+        from_myuser=getattr(followee, 'pk', followee),
+        to_myuser=getattr(follower, 'pk', follower),
+    ).exists()
+
+
+def followed_usernames(follower, usernames):
+    """The subset of `usernames` that `follower` follows, in one query"""
+    usernames = list(usernames)
+    if not usernames:
+        return set()
+    return set(
+        Follow.objects.filter(
+            to_myuser=getattr(follower, 'pk', follower),
+            from_myuser__in=usernames,
+        ).values_list('from_myuser', flat=True)
+    )
+
+
+async def afollowed_usernames(follower, usernames):
+    """followed_usernames() for async views"""
+    usernames = list(usernames)
+    if not usernames:
+        return set()
+    followed = Follow.objects.filter(
+        to_myuser=getattr(follower, 'pk', follower),
+        from_myuser__in=usernames,
+    ).values_list('from_myuser', flat=True)
+    return {username async for username in followed}
+
+
+def _follow_changed(follower, followee, action):
+    # As sent by follower.following.add()/remove()
+    m2m_changed.send(
+        sender=Follow, instance=follower, action=action, reverse=True,
+        model=MyUser, pk_set={followee.pk}, using=router.db_for_write(Follow),
+    )
+
+
+def add_follow(follower, followee):
+    """
+    Make `follower` follow `followee`. Returns whether a row was inserted, so
+    callers only count follows that didn't exist yet, even when racing.
+    """
+    try:
+        with transaction.atomic():
+            Follow.objects.create(from_myuser_id=followee.pk, to_myuser_id=follower.pk)
+    except IntegrityError:
+        return False
+    _follow_changed(follower, followee, 'post_add')
+    return True
+
+
+def remove_follow(follower, followee):
+    """Make `follower` stop following `followee`. Returns whether a row was deleted"""
+    deleted, _ = Follow.objects.filter(from_myuser=followee.pk, to_myuser=follower.pk).delete()
+    if deleted:
+        _follow_changed(follower, followee, 'post_remove')
+    return bool(deleted)
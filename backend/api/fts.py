@@ -0,0 +1,14 @@
+from django.db import connections, router
+
+
+def fts_connection(model, table):
+    """
+    The read connection for `model` if it has the SQLite FTS5 `table`, else
+    None (other backends, or SQLite built without FTS5).
+    """
+    connection = connections[router.db_for_read(model)]
+    if connection.vendor != 'sqlite':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [table])
+        return connection if cursor.fetchone() is not None else None
@@ -0,0 +1,30 @@
+"""
+Password hashers whose work factors come from settings.
+
+The algorithm names are unchanged, so hashes made with Django's stock
+hashers still verify. When a stored hash used another hasher or other work
+factors than the first entry in PASSWORD_HASHERS, Django re-hashes the
+password on the user's next successful login.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PBKDF2_ITERATIONS
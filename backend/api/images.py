@@ -0,0 +1,79 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+EXTENSIONS = {'WEBP': 'webp', 'AVIF': 'avif', 'JPEG': 'jpg'}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _normalize(image):
+    """Apply the EXIF orientation and convert to a mode the output format can store"""
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha and settings.POST_IMAGE_FORMAT != 'JPEG':
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def _encode(image):
+    buffer = BytesIO()
+    # No exif/icc arguments, so none of the upload's metadata is carried over
+    image.save(buffer, format=settings.POST_IMAGE_FORMAT, quality=settings.POST_IMAGE_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def encode_variants(upload):
+    """
+    Decode `upload` (an open image file) and write its size-bounded variants
+    (see settings.POST_IMAGE_VARIANTS) to storage. Returns {variant: {name,
+    width, height}}. Raises InvalidImage if the upload can't be decoded.
+
+    This takes seconds for a large photo, so call it outside any
+    transaction: SQLite holds its write lock for a transaction's lifetime.
+    """
+    upload.seek(0)
+    try:
+        source = Image.open(upload)
+        source.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(f'Could not read the image: {e}')
+    source = _normalize(source)
+
+    base = os.path.splitext(os.path.basename(upload.name))[0]
+    extension = EXTENSIONS.get(settings.POST_IMAGE_FORMAT, settings.POST_IMAGE_FORMAT.lower())
+    variants = {}
+    previous = None
+    # Smallest first, so variants that would come out the same size share one file
+    for name, max_side in sorted(settings.POST_IMAGE_VARIANTS.items(), key=lambda item: item[1]):
+        variant = source.copy()
+        variant.thumbnail((max_side, max_side), Image.LANCZOS)
+        if previous and previous['width'] == variant.width and previous['height'] == variant.height:
+            variants[name] = previous
+            continue
+        path = default_storage.save(f'post_images/{base}_{name}.{extension}', _encode(variant))
+        variants[name] = previous = {'name': path, 'width': variant.width, 'height': variant.height}
+    return variants
+
+
+def variant_fields(variants):
+    """Post field values serving the largest of `variants`"""
+    largest = variants[max(settings.POST_IMAGE_VARIANTS, key=settings.POST_IMAGE_VARIANTS.get)]
+    return {
+        'image': largest['name'],
+        'image_width': largest['width'],
+        'image_height': largest['height'],
+        'image_variants': variants,
+    }
+
+
+def delete_variants(variants):
+    """Remove variant files that ended up unused, e.g. after a rollback"""
+    for path in {variant['name'] for variant in variants.values()}:
+        default_storage.delete(path)
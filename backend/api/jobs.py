@@ -0,0 +1,152 @@
+"""
+Database-backed queue for post image processing.
+
+With IMAGE_PROCESSING='queue' create_post only stores the upload and
+enqueues an ImageJob; `python manage.py process_images` claims jobs and runs
+api.images.encode_variants off the request path. Posts stay `pending`
+(serving the original upload) until their job is done, so the worker has to
+be running. The default, 'inline', processes images inside create_post.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import invalidate_posts
+from .images import InvalidImage, delete_variants, encode_variants, variant_fields
+from .models import Post, ImageJob
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_image(post):
+    post.image_status = Post.IMAGE_PENDING
+    post.save(update_fields=['image_status'])
+    return ImageJob.objects.create(post=post)
+
+
+def claim_next_job():
+    """
+    Atomically take the next runnable job, or return None. Jobs left running
+    longer than IMAGE_JOB_TIMEOUT (a worker died) are picked up again.
+    """
+    now = timezone.now()
+    runnable = ImageJob.objects.filter(
+        Q(status=ImageJob.QUEUED, run_after__lte=now)
+        | Q(status=ImageJob.RUNNING, started_at__lt=now - timedelta(seconds=settings.IMAGE_JOB_TIMEOUT))
+    )
+    for job in runnable.order_by('run_after', 'id')[:10]:
+        # Compare-and-set on status/attempts so two workers can't claim the same job
+        claimed = ImageJob.objects.filter(pk=job.pk, status=job.status, attempts=job.attempts).update(
+            status=ImageJob.RUNNING, attempts=job.attempts + 1, started_at=now,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def _job_failed(job, error):
+    logger.warning("Image job %s failed (attempt %s): %s", job.pk, job.attempts, error)
+    job.last_error = str(error)
+    # An upload that can't be decoded won't decode on a retry either
+    if job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS or isinstance(error, InvalidImage):
+        job.status = ImageJob.FAILED
+        job.finished_at = timezone.now()
+        Post.objects.filter(pk=job.post_id).update(image_status=Post.IMAGE_FAILED)
+        # update() skips the post_save signal
+        invalidate_posts(job.post_id)
+    else:
+        job.status = ImageJob.QUEUED
+        job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts)
+    ImageJob.objects.filter(pk=job.pk).update(
+        status=job.status, last_error=job.last_error, finished_at=job.finished_at, run_after=job.run_after,
+    )
+
+
+def run_job(job):
+    """
+    Process one claimed job, scheduling a retry with backoff if it fails.
+    The encode runs outside any transaction; only recording the result takes
+    the write lock.
+    """
+    try:
+        post = Post.objects.get(pk=job.post_id)
+        original_name = post.image.name
+        with post.image.open('rb') as f:
+            variants = encode_variants(f)
+    except Post.DoesNotExist:
+        # Deleted while queued; the job row went with it
+        return False
+    except Exception as e:
+        _job_failed(job, e)
+        return False
+
+    job.status = ImageJob.DONE
+    job.last_error = ''
+    job.finished_at = timezone.now()
+    try:
+        with transaction.atomic():
+            # Only if the post is still there and still waiting on this upload
+            updated = Post.objects.filter(pk=job.post_id, image_status=Post.IMAGE_PENDING, image=original_name).update(
+                image_status=Post.IMAGE_READY, **variant_fields(variants),
+            )
+            if updated:
+                ImageJob.objects.filter(pk=job.pk).update(
+                    status=job.status, last_error=job.last_error, finished_at=job.finished_at,
+                )
+                transaction.on_commit(lambda: default_storage.delete(original_name))
+    except Exception as e:
+        delete_variants(variants)
+        _job_failed(job, e)
+        return False
+
+    if not updated:
+        delete_variants(variants)
+        logger.info("Image job %s: post %s is gone or no longer pending", job.pk, job.post_id)
+        ImageJob.objects.filter(pk=job.pk).update(status=job.status, finished_at=job.finished_at)
+        return False
+    # update() skips the post_save signal
+    invalidate_posts(job.post_id)
+
+    logger.info(
+        "Processed image for post %s in %.0f ms (%.0f ms after upload)",
+        job.post_id,
+        (job.finished_at - job.started_at).total_seconds() * 1000,
+        (job.finished_at - job.created_at).total_seconds() * 1000,
+    )
+    return True
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def queue_stats(window=timedelta(hours=1)):
+    """Queue depth and processing latency (seconds) of jobs finished within `window`"""
+    now = timezone.now()
+    stats = {
+        status: ImageJob.objects.filter(status=status).count()
+        for status in (ImageJob.QUEUED, ImageJob.RUNNING, ImageJob.FAILED)
+    }
+    oldest = ImageJob.objects.filter(status=ImageJob.QUEUED).order_by('created_at').values_list('created_at', flat=True).first()
+    stats['oldest_queued_age'] = (now - oldest).total_seconds() if oldest else 0
+
+    finished = ImageJob.objects.filter(status=ImageJob.DONE, finished_at__gte=now - window)
+    processing, total = [], []
+    for created_at, started_at, finished_at in finished.values_list('created_at', 'started_at', 'finished_at'):
+        processing.append((finished_at - started_at).total_seconds())
+        total.append((finished_at - created_at).total_seconds())
+    stats['done'] = len(total)
+    stats['processing_p50'] = _percentile(processing, 0.5)
+    stats['processing_p95'] = _percentile(processing, 0.95)
+    stats['end_to_end_p50'] = _percentile(total, 0.5)
+    stats['end_to_end_p95'] = _percentile(total, 0.95)
+    return stats
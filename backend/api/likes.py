@@ -0,0 +1,172 @@
+"""
+Like writes.
+
+PUT/DELETE /api/posts/<id>/like/ say whether the user should like the post,
+rather than toggling, so repeating a request is harmless and only the last
+one per (user, post) matters. With LIKE_FLUSH_INTERVAL > 0 they go through
+`like_writer`, which buffers them in the process and writes everything
+pending in one transaction per interval: a burst of taps on a popular post
+becomes one bulk insert/delete and one counter update. Buffering is off by
+default because it trades durability for that: a 202 means the like is only
+in memory, and it is lost if the process dies before the next flush. Each
+process also runs its own flush thread.
+
+All like writes end in apply_likes(), which locks the affected posts so
+concurrent writers (other processes, the toggle endpoint) can't double count.
+It skips the per-row Like signals and invalidates caches and publishes the
+like events itself, with one counter lookup per flush.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import Case, F, Value, When
+
+from .cache import invalidate_posts
+from .events import author_channel, publish, publishing
+from .models import Like, MyUser, Post
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def _delete_likes(ids):
+    connection = connections[router.db_for_write(Like)]
+    table = connection.ops.quote_name(Like._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            # Plain SQL rather than a queryset delete, which would fetch the
+            # rows and send post_delete for each one
+            cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(batch))})", batch)
+
+
+def _published(changes):
+    """Invalidate caches and publish an event per (username, post_id, liked) change"""
+    post_ids = {post_id for _, post_id, _ in changes}
+    invalidate_posts(*post_ids)
+    if not publishing():
+        return
+    posts = {post['id']: post for post in Post.objects.filter(id__in=post_ids).values('id', 'user_id', 'likes_count', 'comments_count')}
+    for user_id, post_id, liked in changes:
+        post = posts.get(post_id)
+        if post is not None:
+            publish(author_channel(post['user_id']), {
+                'type': 'like',
+                'username': user_id,
+                'liked': liked,
+                'post_id': post_id,
+                'likes_count': post['likes_count'],
+                'comments_count': post['comments_count'],
+            })
+
+
+def apply_likes(changes):
+    """
+    Write {(username, post_id): liked} and adjust likes_count, in one
+    transaction. Changes for posts or users that no longer exist are dropped.
+    Returns the number of likes added or removed.
+    """
+    user_ids = {user_id for user_id, _ in changes}
+    with transaction.atomic():
+        # Concurrent writers queue up on the post rows (in id order, so they
+        # can't deadlock) and then see each other's likes
+        post_ids = set(
+            Post.objects.select_for_update().filter(id__in={post_id for _, post_id in changes})
+            .order_by('id').values_list('id', flat=True)
+        )
+        user_ids = set(MyUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        existing = {
+            (user_id, post_id): like_id for like_id, user_id, post_id
+            in Like.objects.filter(post_id__in=post_ids, user_id__in=user_ids).values_list('id', 'user_id', 'post_id')
+        }
+
+        add, remove = [], []
+        for (user_id, post_id), liked in changes.items():
+            if post_id not in post_ids or user_id not in user_ids:
+                continue
+            if liked and (user_id, post_id) not in existing:
+                add.append((user_id, post_id))
+            elif not liked and (user_id, post_id) in existing:
+                remove.append((user_id, post_id))
+
+        Like.objects.bulk_create([Like(user_id=user_id, post_id=post_id) for user_id, post_id in add], batch_size=BATCH_SIZE)
+        _delete_likes([existing[pair] for pair in remove])
+
+        deltas = Counter(post_id for _, post_id in add)
+        deltas.subtract(post_id for _, post_id in remove)
+        deltas = {post_id: delta for post_id, delta in deltas.items() if delta}
+        if deltas:
+            Post.objects.filter(id__in=deltas).update(likes_count=F('likes_count') + Case(
+                *(When(id=post_id, then=Value(delta)) for post_id, delta in deltas.items()), default=Value(0),
+            ))
+        if add or remove:
+            changed = [(user_id, post_id, True) for user_id, post_id in add]
+            changed += [(user_id, post_id, False) for user_id, post_id in remove]
+            transaction.on_commit(lambda: _published(changed), robust=True)
+    return len(add) + len(remove)
+
+
+class LikeWriter:
+    """Buffers desired like states and writes them from a background thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held for a whole flush, so flushes apply in the order they took their changes
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def set(self, user_id, post_id, liked):
+        """Record that `user_id` should (not) like `post_id`. Returns True if buffered"""
+        if settings.LIKE_FLUSH_INTERVAL <= 0:
+            apply_likes({(user_id, post_id): liked})
+            return False
+
+        with self._lock:
+            self._pending[(user_id, post_id)] = liked
+            if len(self._pending) >= settings.LIKE_FLUSH_MAX_PENDING:
+                self._wakeup.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='like-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        return True
+
+    def flush(self):
+        """
+        Write everything pending now, after any flush already in progress.
+        Returns the number of likes added or removed.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                return apply_likes(pending)
+            except Exception:
+                # Put them back for the next flush, unless they've been superseded
+                with self._lock:
+                    for key, liked in pending.items():
+                        self._pending.setdefault(key, liked)
+                raise
+
+    def _run(self):
+        while True:
+            # With buffering switched off there's nothing to wait for
+            self._wakeup.wait(settings.LIKE_FLUSH_INTERVAL or None)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered likes failed")
+
+
+like_writer = LikeWriter()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.timeline import run_backfills
+
+
+class Command(BaseCommand):
+    help = "Copy recent posts to the followers of authors who dropped to the fan-out threshold; run it periodically (e.g. from cron)"
+
+    def handle(self, *args, **options):
+        done = run_backfills()
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {done} author(s)"))
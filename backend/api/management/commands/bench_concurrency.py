@@ -0,0 +1,80 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bench import latency_summary
+
+DEFAULT_PATHS = ['feed/', 'explore/', 'users/search/?query=a']
+
+
+class Command(BaseCommand):
+    help = (
+        "Hit a running server with concurrent GETs and report throughput and latency. "
+        "Run it once against the WSGI deployment and once with --prefix /api/async/ "
+        "against the ASGI one to compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS,
+                            help="Endpoint paths relative to --prefix")
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--prefix', default='/api/', help="/api/ (sync) or /api/async/")
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=1000, help="Total requests per path")
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        token = self.get_token(base_url, options['username'], options['password'], options['timeout'])
+        headers = {'Authorization': f'Bearer {token}'}
+
+        for path in options['paths']:
+            url = base_url + '/' + (options['prefix'].strip('/') + '/' + path.lstrip('/')).lstrip('/')
+            self.run_path(url, headers, options)
+
+    def get_token(self, base_url, username, password, timeout):
+        body = json.dumps({'username': username, 'password': password}).encode()
+        request = urllib.request.Request(
+            f'{base_url}/api/token/', data=body, headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read())['access']
+        except (urllib.error.URLError, KeyError, ValueError) as e:
+            raise CommandError(f"Could not get a token from {base_url}/api/token/: {e}")
+
+    def run_path(self, url, headers, options):
+        def fetch(_):
+            request = urllib.request.Request(url, headers=headers)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, TimeoutError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, ok in results if ok)
+        errors = len(results) - len(latencies)
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f"{url}: all {errors} request(s) failed"))
+            return
+
+        self.stdout.write(
+            f"{url}\n"
+            f"  {len(latencies) / elapsed:.1f} req/s over {elapsed:.2f}s, "
+            f"concurrency {options['concurrency']}, {errors} error(s)\n"
+            f"  {latency_summary(latencies)}"
+        )
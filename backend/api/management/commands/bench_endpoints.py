@@ -0,0 +1,214 @@
+import io
+import json
+import shutil
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.bench import latency_summary, percentiles
+from api.models import MyUser, Post
+from api.profiling import RequestProfile
+
+
+class Rollback(Exception):
+    pass
+
+
+def _image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1200, 900), 'orange').save(buffer, 'JPEG')
+    buffer.seek(0)
+    buffer.name = 'bench.jpg'
+    return buffer
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the API endpoints in-process through the Django test client and report latency "
+        "percentiles, queries per request and single-client throughput. Write endpoints run in a "
+        "transaction that is rolled back, so their on-commit work (cache invalidation, events) "
+        "isn't timed. Run `generate_data` first for a realistic dataset. Signup/login are covered "
+        "by bench_login and the async endpoints by bench_concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', help="Only these (default: all), e.g. feed explore")
+        parser.add_argument('--username', help="Viewer (default: the user following the most people)")
+        parser.add_argument('--requests', type=int, default=50, help="Timed requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=5, help="Untimed requests per endpoint first")
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every request")
+        parser.add_argument('--save', metavar='FILE', help="Write the results as a JSON baseline")
+        parser.add_argument('--compare', metavar='FILE', help="Compare against a saved baseline")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="p95 slowdown that counts as a regression (default 0.2 = 20%%)")
+
+    def handle(self, *args, **options):
+        viewer, author, stranger, post = self.pick_subjects(options['username'])
+        client = Client(headers={'Authorization': f'Bearer {AccessToken.for_user(viewer)}'})
+        reads, writes = self.endpoints(viewer, author, stranger, post)
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - {name for name, *_ in reads + writes}
+            if unknown:
+                raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+            reads = [endpoint for endpoint in reads if endpoint[0] in options['endpoints']]
+            writes = [endpoint for endpoint in writes if endpoint[0] in options['endpoints']]
+
+        self.stdout.write(f"Viewer {viewer.pk}, {options['requests']} requests per endpoint\n")
+        results = {}
+        for endpoint in reads:
+            results[endpoint[0]] = self.run(client, *endpoint, options)
+
+        if writes:
+            media_root = tempfile.mkdtemp()
+            try:
+                # Likes written straight away rather than by the background writer
+                with override_settings(MEDIA_ROOT=media_root, LIKE_FLUSH_INTERVAL=0), transaction.atomic():
+                    for endpoint in writes:
+                        results[endpoint[0]] = self.run(client, *endpoint, options)
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                shutil.rmtree(media_root, ignore_errors=True)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump({'requests': options['requests'], 'endpoints': results}, f, indent=2)
+            self.stdout.write(f"\nSaved baseline to {options['save']}")
+        if options['compare']:
+            self.compare(results, options['compare'], options['threshold'])
+
+    def pick_subjects(self, username):
+        if username:
+            viewer = MyUser.objects.filter(pk=username).first()
+            if viewer is None:
+                raise CommandError(f"No user {username!r}")
+        else:
+            viewer = MyUser.objects.order_by('-following_count', 'pk').first()
+            if viewer is None:
+                raise CommandError("No users, run `manage.py generate_data` first")
+        author = MyUser.objects.exclude(pk=viewer.pk).order_by('-follower_count', 'pk').first()
+        # Someone the viewer doesn't follow, for follow/unfollow
+        stranger = MyUser.objects.exclude(pk=viewer.pk).exclude(followers=viewer).order_by('pk').first()
+        post = Post.objects.annotate(n=Count('comments')).order_by('-n', '-id').first()
+        if author is None or stranger is None or post is None:
+            raise CommandError("Need at least three users and a post, run `manage.py generate_data` first")
+        return viewer, author, stranger, post
+
+    def endpoints(self, viewer, author, stranger, post):
+        """(name, method, path, data, content_type) for the reads and the writes"""
+        others = list(MyUser.objects.exclude(pk=viewer.pk).order_by('pk').values_list('pk', flat=True)[:50])
+        query = (author.first_name or author.pk)[:3].lower()
+        json_type = 'application/json'
+        reads = [
+            ('current_user', 'get', reverse('current_user'), None, None),
+            ('user_profile', 'get', reverse('user_profile', args=[author.pk]), None, None),
+            ('user_posts', 'get', reverse('user_posts', args=[author.pk]), None, None),
+            ('user_followers', 'get', reverse('user_followers', args=[author.pk]), None, None),
+            ('user_following', 'get', reverse('user_following', args=[viewer.pk]), None, None),
+            ('search_users', 'get', reverse('search_users') + f'?query={query}', None, None),
+            ('follow_state', 'post', reverse('follow_state'), {'usernames': others}, json_type),
+            ('feed', 'get', reverse('feed'), None, None),
+            ('explore', 'get', reverse('explore'), None, None),
+            ('search_recipes', 'get', reverse('search_recipes') + '?query=pasta', None, None),
+            ('post_comments', 'get', reverse('post_comments', args=[post.id]), None, None),
+        ]
+        like = reverse('like_post', args=[post.id])
+        writes = [
+            ('like_post', 'put', like, None, None),
+            ('unlike_post', 'delete', like, None, None),
+            ('add_comment', 'post', reverse('add_comment', args=[post.id]), {'text': 'Benchmark comment'}, json_type),
+            # Toggles, so alternates follow and unfollow
+            ('follow_user', 'post', reverse('follow_user', args=[stranger.pk]), None, None),
+            ('batch', 'post', reverse('batch'), {'operations': [
+                {'op': 'like', 'post_id': post.id},
+                {'op': 'comment', 'post_id': post.id, 'text': 'Benchmark comment'},
+                {'op': 'follow', 'username': stranger.pk},
+                {'op': 'unlike', 'post_id': post.id},
+                {'op': 'unfollow', 'username': stranger.pk},
+            ]}, json_type),
+            ('create_post', 'post', reverse('create_post'), _image, None),
+        ]
+        return reads, writes
+
+    def send(self, client, method, path, data, content_type):
+        if callable(data):
+            # Multipart uploads need a fresh file each time
+            return client.post(path, {'image': data(), 'caption': json.dumps({'title': 'Benchmark'})})
+        kwargs = {'content_type': content_type} if content_type else {}
+        if data is not None:
+            kwargs['data'] = json.dumps(data) if content_type == 'application/json' else data
+        return getattr(client, method)(path, **kwargs)
+
+    def run(self, client, name, method, path, data, content_type, options):
+        for _ in range(options['warmup']):
+            self.check_response(name, self.send(client, method, path, data, content_type))
+
+        latencies, queries, db_seconds, sizes = [], 0, 0.0, 0
+        for _ in range(options['requests']):
+            if options['cold']:
+                cache.clear()
+            profile = RequestProfile(keep_sql=False)
+            with profile.wrap_connections():
+                started = time.perf_counter()
+                response = self.send(client, method, path, data, content_type)
+                latencies.append(time.perf_counter() - started)
+            self.check_response(name, response)
+            queries += profile.queries
+            db_seconds += profile.db_seconds
+            sizes += len(response.content)
+
+        count = len(latencies)
+        result = {
+            **percentiles(latencies),
+            'queries': queries / count,
+            'db_seconds': db_seconds / count,
+            'rps': count / sum(latencies),
+            'bytes': sizes // count,
+        }
+        self.stdout.write(
+            f"{name:<15} {latency_summary(latencies)}  {result['queries']:.1f} queries "
+            f"({result['db_seconds'] * 1000:.1f}ms)  {result['rps']:.0f} req/s  {result['bytes']}B"
+        )
+        return result
+
+    def check_response(self, name, response):
+        if response.status_code >= 400:
+            raise CommandError(f"{name}: {response.status_code} {response.content[:200]!r}")
+
+    def compare(self, results, path, threshold):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)['endpoints']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Could not read baseline {path}: {e}")
+
+        self.stdout.write(f"\nCompared with {path}:")
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                self.stdout.write(f"{name:<15} not in baseline")
+                continue
+            change = result['p95'] / before['p95'] - 1 if before['p95'] else 0
+            line = (
+                f"{name:<15} p95 {before['p95'] * 1000:.1f}ms -> {result['p95'] * 1000:.1f}ms ({change:+.0%})  "
+                f"queries {before['queries']:.1f} -> {result['queries']:.1f}"
+            )
+            if change > threshold or result['queries'] > before['queries']:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"Regressed: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS("No regressions"))
@@ -0,0 +1,86 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils.module_loading import import_string
+
+from api.bench import latency_summary
+from api.models import MyUser
+
+PASSWORD = 'bench-Password-123'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time token/ logins and user/signup/ in-process, one request at a time, and report "
+        "requests per CPU-second (i.e. per core) with latency percentiles. Nothing is kept "
+        "in the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Requests per endpoint")
+        parser.add_argument(
+            '--hasher', action='append',
+            help="Algorithm to make preferred, e.g. argon2 or pbkdf2_sha256. Repeat to compare; "
+                 "defaults to the configured one.",
+        )
+
+    def handle(self, *args, **options):
+        algorithms = {import_string(path).algorithm: path for path in settings.PASSWORD_HASHERS}
+        for algorithm in options['hasher'] or [get_hasher().algorithm]:
+            if algorithm not in algorithms:
+                raise CommandError(f"Unknown hasher {algorithm!r}, choose from {', '.join(algorithms)}")
+            preferred = algorithms[algorithm]
+            hashers = [preferred, *(path for path in settings.PASSWORD_HASHERS if path != preferred)]
+            with override_settings(PASSWORD_HASHERS=hashers):
+                try:
+                    get_hasher().encode(PASSWORD, get_hasher().salt())
+                except ValueError as e:
+                    # The hasher's library isn't installed
+                    self.stdout.write(self.style.ERROR(f"{algorithm}: {e}"))
+                    continue
+                self.run(algorithm, options['requests'])
+
+    def run(self, algorithm, requests):
+        client = Client()
+        try:
+            with transaction.atomic():
+                username = f'bench-{uuid.uuid4().hex[:8]}'
+                MyUser.objects.create_user(username=username, password=PASSWORD)
+                self.report(algorithm, 'token/', self.time(requests, lambda i: client.post(
+                    '/api/token/', {'username': username, 'password': PASSWORD}, content_type='application/json',
+                )))
+                self.report(algorithm, 'user/signup/', self.time(requests, lambda i: client.post(
+                    '/api/user/signup/', {'username': f'{username}-{i}', 'password': PASSWORD},
+                    content_type='application/json',
+                )))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def time(self, requests, send):
+        latencies = []
+        cpu_started = time.process_time()
+        for i in range(requests):
+            started = time.perf_counter()
+            response = send(i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                raise CommandError(f"{response.status_code}: {response.content[:200]!r}")
+        return latencies, time.process_time() - cpu_started
+
+    def report(self, algorithm, path, result):
+        latencies, cpu_seconds = result
+        self.stdout.write(
+            f"{algorithm} {path}: {len(latencies) / cpu_seconds:.1f}/s per core "
+            f"({len(latencies) / sum(latencies):.1f}/s wall)  {latency_summary(latencies)}"
+        )
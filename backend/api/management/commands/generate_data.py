@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.datagen import generate
+from api.models import MyUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic social graph for benchmarking: users with a "
+        "power-law follower graph, recipe posts, likes and comments. Every generated user's "
+        "password is 'password'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts-per-user', type=float, default=5, help="Mean")
+        parser.add_argument('--follows-per-user', type=float, default=30, help="Mean")
+        parser.add_argument('--likes-per-post', type=float, default=10, help="Mean")
+        parser.add_argument('--comments-per-post', type=float, default=2, help="Mean")
+        parser.add_argument('--days', type=int, default=30, help="Spread posts over this many days")
+        parser.add_argument('--prefix', default='gen', help="Usernames are <prefix>000000, <prefix>000001, ...")
+        parser.add_argument('--seed', type=int, help="Random seed, for a repeatable dataset")
+
+    def handle(self, *args, **options):
+        if MyUser.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users starting with {options['prefix']!r} already exist, pick another --prefix")
+
+        created = generate(
+            users=options['users'],
+            posts_per_user=options['posts_per_user'],
+            follows_per_user=options['follows_per_user'],
+            likes_per_post=options['likes_per_post'],
+            comments_per_post=options['comments_per_post'],
+            days=options['days'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Created " + ", ".join(f"{count} {table}" for table, count in created.items())
+        ))
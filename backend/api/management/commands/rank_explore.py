@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.explore import update_ranks
+
+
+class Command(BaseCommand):
+    help = "Rescore the explore feed for posts whose likes/comments changed; run it periodically (e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rescore every recent post, e.g. after changing EXPLORE_* settings")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rescored, expired = update_ranks(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"Rescored {rescored} post(s), dropped {expired} old one(s)"))
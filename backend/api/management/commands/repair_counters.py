@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import find_drift, post_counter_expressions, repair, user_counter_expressions
+from api.models import MyUser, Post
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized like/comment/follower/post counters and fix any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report drifted rows")
+
+    def handle(self, *args, **options):
+        for model, expressions in ((Post, post_counter_expressions()), (MyUser, user_counter_expressions())):
+            drift = find_drift(model, expressions)
+            for name, rows in drift.items():
+                self.stdout.write(f"{model.__name__}.{name}: {rows} row(s) out of date")
+
+            if options['dry_run'] or not any(drift.values()):
+                continue
+            with transaction.atomic():
+                updated = repair(model, expressions)
+            self.stdout.write(self.style.SUCCESS(f"Recomputed counters on {updated} {model.__name__} row(s)"))
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:26
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count_of(queryset, field):
+    counts = queryset.order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def backfill_counters(apps, schema_editor):
+    MyUser = apps.get_model('api', 'MyUser')
+    Post = apps.get_model('api', 'Post')
+    Like = apps.get_model('api', 'Like')
+    Comment = apps.get_model('api', 'Comment')
+    follows = MyUser.followers.through.objects
+
+    Post.objects.update(
+        likes_count=_count_of(Like.objects.filter(post=OuterRef('pk')), 'post'),
+        comments_count=_count_of(Comment.objects.filter(post=OuterRef('pk')), 'post'),
+    )
+    MyUser.objects.update(
+        follower_count=_count_of(follows.filter(from_myuser=OuterRef('pk')), 'from_myuser'),
+        following_count=_count_of(follows.filter(to_myuser=OuterRef('pk')), 'to_myuser'),
+        posts_count=_count_of(Post.objects.filter(user=OuterRef('pk')), 'user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_myuser_profile_image_alter_myuser_bio_post_comment_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:27
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+# The FTS5 index over api_recipe, kept in sync by triggers
+CREATE_FTS_SQL = [
+    """CREATE VIRTUAL TABLE api_recipe_fts USING fts5(
+        title, ingredients, instructions, tags,
+        content='api_recipe', content_rowid='post_id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER api_recipe_ai AFTER INSERT ON api_recipe BEGIN
+        INSERT INTO api_recipe_fts(rowid, title, ingredients, instructions, tags)
+        VALUES (new.post_id, new.title, new.ingredients, new.instructions, new.tags);
+    END""",
+    """CREATE TRIGGER api_recipe_ad AFTER DELETE ON api_recipe BEGIN
+        INSERT INTO api_recipe_fts(api_recipe_fts, rowid, title, ingredients, instructions, tags)
+        VALUES ('delete', old.post_id, old.title, old.ingredients, old.instructions, old.tags);
+    END""",
+    """CREATE TRIGGER api_recipe_au AFTER UPDATE ON api_recipe BEGIN
+        INSERT INTO api_recipe_fts(api_recipe_fts, rowid, title, ingredients, instructions, tags)
+        VALUES ('delete', old.post_id, old.title, old.ingredients, old.instructions, old.tags);
+        INSERT INTO api_recipe_fts(rowid, title, ingredients, instructions, tags)
+        VALUES (new.post_id, new.title, new.ingredients, new.instructions, new.tags);
+    END""",
+]
+
+DROP_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS api_recipe_ai",
+    "DROP TRIGGER IF EXISTS api_recipe_ad",
+    "DROP TRIGGER IF EXISTS api_recipe_au",
+    "DROP TABLE IF EXISTS api_recipe_fts",
+]
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ''
+
+
+def parse_recipe(caption):
+    # api.recipes.parse_recipe() as of this migration
+    try:
+        data = json.loads(caption)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    ingredients = data.get('ingredients')
+    if not isinstance(ingredients, list):
+        ingredients = []
+    names = [i.get('name') if isinstance(i, dict) else i for i in ingredients]
+
+    tags = data.get('tags')
+    if isinstance(tags, str):
+        tags = [tags]
+    elif not isinstance(tags, list):
+        tags = []
+
+    return {
+        'title': _text(data.get('title'))[:255],
+        'ingredients': '\n'.join(_text(n) for n in names if _text(n)),
+        'instructions': _text(data.get('instructions')),
+        'tags': ' '.join(_text(t) for t in tags if _text(t))[:500],
+    }
+
+
+def create_fts_index(apps, schema_editor):
+    # FTS5 is SQLite only; other backends fall back to a title substring match
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        for sql in CREATE_FTS_SQL:
+            schema_editor.execute(sql)
+    except OperationalError:
+        # SQLite built without FTS5
+        for sql in DROP_FTS_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def backfill_recipes(apps, schema_editor):
+    Post = apps.get_model('api', 'Post')
+    Recipe = apps.get_model('api', 'Recipe')
+    recipes = []
+    for post_id, caption in Post.objects.values_list('id', 'caption').iterator():
+        fields = parse_recipe(caption)
+        if fields is not None:
+            recipes.append(Recipe(post_id=post_id, **fields))
+    Recipe.objects.bulk_create(recipes, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe', serialize=False, to='api.post')),
+                ('title', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('ingredients', models.TextField(blank=True)),
+                ('instructions', models.TextField(blank=True)),
+                ('tags', models.CharField(blank=True, max_length=500)),
+            ],
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+        migrations.RunPython(backfill_recipes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+# The FTS5 trigram index over api_usersearch, kept in sync by triggers
+CREATE_FTS_SQL = [
+    """CREATE VIRTUAL TABLE api_usersearch_fts USING fts5(
+        username, first_name, last_name,
+        content='api_usersearch', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER api_usersearch_ai AFTER INSERT ON api_usersearch BEGIN
+        INSERT INTO api_usersearch_fts(rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END""",
+    """CREATE TRIGGER api_usersearch_ad AFTER DELETE ON api_usersearch BEGIN
+        INSERT INTO api_usersearch_fts(api_usersearch_fts, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+    END""",
+    """CREATE TRIGGER api_usersearch_au AFTER UPDATE ON api_usersearch BEGIN
+        INSERT INTO api_usersearch_fts(api_usersearch_fts, rowid, username, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.first_name, old.last_name);
+        INSERT INTO api_usersearch_fts(rowid, username, first_name, last_name)
+        VALUES (new.id, new.username, new.first_name, new.last_name);
+    END""",
+]
+
+DROP_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS api_usersearch_ai",
+    "DROP TRIGGER IF EXISTS api_usersearch_ad",
+    "DROP TRIGGER IF EXISTS api_usersearch_au",
+    "DROP TABLE IF EXISTS api_usersearch_fts",
+]
+
+
+def create_fts_index(apps, schema_editor):
+    # FTS5 is SQLite only; other backends fall back to the lowercased columns
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        for sql in CREATE_FTS_SQL:
+            schema_editor.execute(sql)
+    except OperationalError:
+        # SQLite built without FTS5 or the trigram tokenizer
+        for sql in DROP_FTS_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def backfill_user_search(apps, schema_editor):
+    MyUser = apps.get_model('api', 'MyUser')
+    UserSearch = apps.get_model('api', 'UserSearch')
+    entries = [
+        UserSearch(
+            user_id=username,
+            username=username.strip().lower(),
+            first_name=first_name.strip().lower(),
+            last_name=last_name.strip().lower(),
+        )
+        for username, first_name, last_name in MyUser.objects.values_list('username', 'first_name', 'last_name').iterator()
+    ]
+    UserSearch.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_image_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(db_index=True, max_length=50)),
+                ('first_name', models.CharField(db_index=True, max_length=150)),
+                ('last_name', models.CharField(db_index=True, max_length=150)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+        migrations.RunPython(backfill_user_search, migrations.RunPython.noop),
+    ]
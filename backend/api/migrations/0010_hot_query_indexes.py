@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_user_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='comment_post_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='post_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='post_recent'),
+        ),
+        # The auto-created followers table can't declare Meta.indexes. Its
+        # unique (from_myuser, to_myuser) index serves a user's followers;
+        # this one serves who a user follows, already in username order.
+        migrations.RunSQL(
+            'CREATE INDEX follow_following ON api_myuser_followers (to_myuser_id, from_myuser_id)',
+            'DROP INDEX follow_following',
+        ),
+    ]
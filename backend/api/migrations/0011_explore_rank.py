@@ -0,0 +1,70 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:54
+
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+
+def score_posts(posts):
+    # api.explore.score_posts() as of this migration
+    step = math.log2(settings.EXPLORE_AUTHOR_PENALTY)
+    by_author = defaultdict(list)
+    for post_id, author_id, created_at, likes, comments in posts:
+        engagement = 1 + likes + settings.EXPLORE_COMMENT_WEIGHT * comments
+        by_author[author_id].append({
+            'post_id': post_id,
+            'author_id': author_id,
+            'created_at': created_at,
+            'likes_count': likes,
+            'comments_count': comments,
+            'base_score': math.log2(engagement) + created_at.timestamp() / 3600 / settings.EXPLORE_HALF_LIFE_HOURS,
+        })
+
+    rows = []
+    for author_rows in by_author.values():
+        author_rows.sort(key=lambda row: (row['base_score'], row['post_id']), reverse=True)
+        for k, row in enumerate(author_rows):
+            rows.append({**row, 'score': row['base_score'] + k * step})
+    return rows
+
+
+def backfill_ranks(apps, schema_editor):
+    Post = apps.get_model('api', 'Post')
+    ExploreRank = apps.get_model('api', 'ExploreRank')
+    since = timezone.now() - timedelta(days=settings.EXPLORE_WINDOW_DAYS)
+    posts = Post.objects.filter(created_at__gte=since).values_list(
+        'id', 'user_id', 'created_at', 'likes_count', 'comments_count',
+    )
+    ExploreRank.objects.bulk_create([ExploreRank(**row) for row in score_posts(posts)], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExploreRank',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='explore_rank', serialize=False, to='api.post')),
+                ('created_at', models.DateTimeField()),
+                ('likes_count', models.PositiveIntegerField(default=0)),
+                ('comments_count', models.PositiveIntegerField(default=0)),
+                ('base_score', models.FloatField()),
+                ('score', models.FloatField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-post'], name='explore_rank_score'), models.Index(fields=['author', '-base_score'], name='explore_rank_author'), models.Index(fields=['created_at'], name='explore_rank_created')],
+            },
+        ),
+        migrations.RunPython(backfill_ranks, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
@@ -8,6 +9,12 @@ class MyUser(AbstractUser):
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
 
+    # Denormalized counters, kept in step by the views with F() updates.
+    # `python manage.py repair_counters` recomputes them if they drift.
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+
     groups = models.ManyToManyField(
         'auth.Group',
         related_name='myuser_groups',  # Avoids conflict with auth.User.groups
@@ -19,28 +26,93 @@ class MyUser(AbstractUser):
         blank=True
     )
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(UserSearch.SOURCE_FIELDS):
+            UserSearch.update_for(self)
+
+    def __str__(self):
+        return self.username
+
+class UserSearch(models.Model):
+    """
+    Lowercased copy of the searchable MyUser fields, refreshed by MyUser.save().
+    Prefix lookups use the column indexes; on SQLite an FTS5 trigram table
+    (see api/user_search.py) handles substring matches.
+    """
+    SOURCE_FIELDS = ('username', 'first_name', 'last_name')
+
+    user = models.OneToOneField(MyUser, on_delete=models.CASCADE, related_name='search_entry')
+    username = models.CharField(max_length=50, db_index=True)
+    first_name = models.CharField(max_length=150, db_index=True)
+    last_name = models.CharField(max_length=150, db_index=True)
+
+    @classmethod
+    def update_for(cls, user):
+        cls.objects.update_or_create(user=user, defaults={
+            field: getattr(user, field).strip().lower() for field in cls.SOURCE_FIELDS
+        })
+
     def __str__(self):
         return self.username
 
+class PostQuerySet(models.QuerySet):
+    def for_viewer(self, user):
+        """
+        Everything PostSerializer reads, fetched up front: the author, whether
+        `user` liked the post and the latest few comments with their authors.
+        """
+        if user is not None and user.is_authenticated:
+            viewer_liked = models.Exists(Like.objects.filter(post=models.OuterRef('pk'), user=user))
+        else:
+            viewer_liked = models.Value(False, output_field=models.BooleanField())
+        return self.select_related('user').annotate(
+            viewer_liked=viewer_liked,
+        ).prefetch_related(
+            # Sliced prefetch: at most COMMENT_PREVIEW_COUNT rows per post
+            models.Prefetch(
+                'comments',
+                queryset=Comment.objects.select_related('user').order_by('-created_at', '-id')[:settings.COMMENT_PREVIEW_COUNT],
+                to_attr='preview_comments',
+            ),
+        )
+
 class Post(models.Model):
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_PENDING, 'Pending'),
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='posts')
     image = models.ImageField(upload_to='post_images/')
+    image_status = models.CharField(max_length=10, choices=IMAGE_STATUS_CHOICES, default=IMAGE_READY)
+    # Filled in from api.images.encode_variants(): {variant: {name, width, height}}
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True)
     caption = models.TextField(blank=True)
     created_at = models.DateTimeField(default=timezone.now)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    objects = PostQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Profile pages and the feed: one author's posts, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_recent'),
+            # Explore and keyset pagination over all posts
+            models.Index(fields=['-created_at', '-id'], name='post_recent'),
+        ]
         
     def __str__(self):
         return f"Post by {self.user.username} at {self.created_at}"
-    
-    @property
-    def likes_count(self):
-        return self.likes.count()
-    
-    @property
-    def comments_count(self):
-        return self.comments.count()
 
 class Like(models.Model):
     user = models.ForeignKey(MyUser, on_delete=models.CASCADE)
@@ -61,6 +133,106 @@ class Comment(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Comment previews and posts/<id>/comments/ pages
+            models.Index(fields=['post', '-created_at', '-id'], name='comment_post_recent'),
+        ]
         
     def __str__(self):
-        return f"Comment by {self.user.username} on {self.post}"
\ No newline at end of file
+        return f"Comment by {self.user.username} on {self.post}"
+
+class Recipe(models.Model):
+    """Recipe fields parsed out of a post's JSON caption when the post is created"""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='recipe')
+    title = models.CharField(max_length=255, blank=True, db_index=True)
+    ingredients = models.TextField(blank=True)
+    instructions = models.TextField(blank=True)
+    tags = models.CharField(max_length=500, blank=True)
+
+    def __str__(self):
+        return self.title
+
+class TimelineEntry(models.Model):
+    """
+    A post delivered to `owner`'s home feed, written when the post is created
+    (fan-out-on-write). Only used when settings.TIMELINE_FANOUT is on.
+    """
+    owner = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    # Copied from the post so a page is read straight off the (owner, created_at) index
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_recent'),
+        ]
+
+    def __str__(self):
+        return f"{self.post} in {self.owner.username}'s timeline"
+
+class TimelineBackfill(models.Model):
+    """
+    An author who just dropped to TIMELINE_FANOUT_MAX_FOLLOWERS and whose
+    followers still need their recent posts (see api/timeline.py)
+    """
+    author = models.OneToOneField(MyUser, on_delete=models.CASCADE, primary_key=True, related_name='timeline_backfill')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Timeline backfill for {self.author_id}"
+
+class ImageJob(models.Model):
+    """A post image waiting for `manage.py process_images` (see api/jobs.py)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='image_job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='imagejob_status_run_after'),
+        ]
+
+    def __str__(self):
+        return f"Image job for post {self.post_id} ({self.status})"
+
+class ExploreRank(models.Model):
+    """
+    A post's place in the explore feed, maintained by `manage.py rank_explore`
+    (see api/explore.py). Explore pages are read straight off the score index.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='explore_rank')
+    author = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    # The counters the score was computed from, to spot posts that need rescoring
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    # Recency-decayed engagement, and that after the author diversity penalty
+    base_score = models.FloatField()
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post'], name='explore_rank_score'),
+            models.Index(fields=['author', '-base_score'], name='explore_rank_author'),
+            models.Index(fields=['created_at'], name='explore_rank_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.post} ranked {self.score:.2f}"
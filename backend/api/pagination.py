@@ -0,0 +1,189 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    """Turn the (created_at, id) of the last item on a page into an opaque token"""
+    payload = json.dumps([created_at.isoformat(), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor, raises InvalidCursor on anything malformed"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(created_at)
+        if created_at is None or not isinstance(pk, int):
+            raise ValueError
+        return created_at, pk
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def get_page_size(request, default=None, maximum=None):
+    """Read ?page_size=, clamped to [1, maximum]"""
+    default = default or settings.FEED_PAGE_SIZE
+    maximum = maximum or settings.FEED_MAX_PAGE_SIZE
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def apply_cursor(queryset, cursor, key='id'):
+    """Restrict `queryset` to rows strictly after `cursor` in (-created_at, -key) order"""
+    created_at, pk = decode_cursor(cursor)
+    return queryset.filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, **{f'{key}__lt': pk})
+    )
+
+
+def paginate_queryset(queryset, request, default=None, maximum=None, key='id'):
+    """
+    Keyset pagination over (-created_at, -key).
+
+    Returns (items, next_cursor). The page is fetched with one extra row so we
+    know whether another page exists without running a COUNT.
+    """
+    page_size = get_page_size(request, default, maximum)
+    items = list(_page_queryset(queryset, request, page_size, key))
+    return _split_page(items, page_size, key)
+
+
+async def apaginate_queryset(queryset, request, default=None, maximum=None, key='id'):
+    """paginate_queryset() for async views"""
+    page_size = get_page_size(request, default, maximum)
+    items = [item async for item in _page_queryset(queryset, request, page_size, key)]
+    return _split_page(items, page_size, key)
+
+
+def _page_queryset(queryset, request, page_size, key):
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        queryset = apply_cursor(queryset, cursor, key)
+    return queryset.order_by('-created_at', f'-{key}')[:page_size + 1]
+
+
+def _split_page(items, page_size, key):
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, getattr(last, key))
+    return items, next_cursor
+
+
+def encode_key_cursor(value):
+    """Opaque token for the last value of a single, unique sort key"""
+    payload = json.dumps([value], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_key_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(value, (str, int)):
+            raise ValueError
+        return value
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def encode_search_cursor(tier, followers, username):
+    """Opaque token for the (tier, follower_count, username) of the last search result"""
+    payload = json.dumps([tier, followers, username], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        tier, followers, username = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(tier, int) or not isinstance(followers, int) or not isinstance(username, str):
+            raise ValueError
+        return tier, followers, username
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def paginate_by_key(queryset, request, key, default=None, maximum=None):
+    """
+    Keyset pagination in ascending order of one unique column, for rows with
+    no created_at (e.g. the followers through table). `queryset` should be a
+    flat values_list of `key`.
+    """
+    page_size = get_page_size(request, default, maximum)
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        queryset = queryset.filter(**{f'{key}__gt': decode_key_cursor(cursor)})
+    values = list(queryset.order_by(key)[:page_size + 1])
+
+    next_cursor = None
+    if len(values) > page_size:
+        values = values[:page_size]
+        next_cursor = encode_key_cursor(values[-1])
+    return values, next_cursor
+
+
+def encode_score_cursor(score, pk):
+    """Opaque token for the (score, id) of the last item on a ranked page"""
+    payload = json.dumps([score, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_score_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        score, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(score, (int, float)) or not isinstance(pk, int):
+            raise ValueError
+        return score, pk
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def paginate_by_score(queryset, request, score, key, default=None, maximum=None):
+    """
+    Keyset pagination over (-score, -key), for ranked rows such as
+    ExploreRank. Returns (items, next_cursor) like paginate_queryset().
+    """
+    page_size = get_page_size(request, default, maximum)
+    items = list(_score_page_queryset(queryset, request, page_size, score, key))
+    return _split_score_page(items, page_size, score, key)
+
+
+async def apaginate_by_score(queryset, request, score, key, default=None, maximum=None):
+    """paginate_by_score() for async views"""
+    page_size = get_page_size(request, default, maximum)
+    items = [item async for item in _score_page_queryset(queryset, request, page_size, score, key)]
+    return _split_score_page(items, page_size, score, key)
+
+
+def _score_page_queryset(queryset, request, page_size, score, key):
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        last_score, pk = decode_score_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{score}__lt': last_score}) | Q(**{score: last_score, f'{key}__lt': pk})
+        )
+    return queryset.order_by(f'-{score}', f'-{key}')[:page_size + 1]
+
+
+def _split_score_page(items, page_size, score, key):
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_score_cursor(getattr(last, score), getattr(last, key))
+    return items, next_cursor
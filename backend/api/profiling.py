@@ -0,0 +1,235 @@
+"""
+Per-endpoint request profiling, switched on by settings.PROFILING.
+
+ProfilingMiddleware records, for every request and labelled by view name:
+wall time, the number and total time of database queries (through
+connection.execute_wrapper on every configured database), the time spent
+rendering the response body and its size. metrics() serves them at /metrics
+as Prometheus histograms, together with the image queue stats. The numbers
+live in the process, so scrape each worker.
+
+Rendering is DRF turning response.data into JSON; building response.data
+(serializers, cache fragments) counts as view time.
+
+With PROFILING_SLOW_REQUEST_MS set, requests slower than that are logged
+with their SQL.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .jobs import queue_stats
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Statements kept per request for the slow request log
+MAX_LOGGED_QUERIES = 50
+
+
+def _labels(labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in labels)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            # Per bucket counts, then the sum and the count
+            series = self._series.setdefault(labels, [0] * len(self.buckets) + [0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                yield f'{self.name}_bucket{{{_labels(labels + (("le", bound),))}}} {count}'
+            yield f'{self.name}_bucket{{{_labels(labels + (("le", "+Inf"),))}}} {values[-1]}'
+            yield f'{self.name}_sum{{{_labels(labels)}}} {values[-2]}'
+            yield f'{self.name}_count{{{_labels(labels)}}} {values[-1]}'
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + 1
+
+    def collect(self):
+        with self._lock:
+            series = dict(self._series)
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(series.items()):
+            yield f'{self.name}{{{_labels(labels)}}} {value}'
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+REQUESTS = Counter('http_requests_total', 'Requests by view, method and status.')
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Wall time per request.', LATENCY_BUCKETS)
+DB_QUERIES = Histogram('http_request_db_queries', 'Database queries per request.', QUERY_COUNT_BUCKETS)
+DB_SECONDS = Histogram('http_request_db_duration_seconds', 'Time in database queries per request.', LATENCY_BUCKETS)
+RENDER_SECONDS = Histogram('http_response_render_seconds', 'Time rendering the response body.', LATENCY_BUCKETS)
+RESPONSE_BYTES = Histogram('http_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+
+METRICS = [REQUESTS, REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, RENDER_SECONDS, RESPONSE_BYTES]
+
+
+class RequestProfile:
+    """Collects one request's queries, as an execute wrapper"""
+
+    def __init__(self, keep_sql):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.sql = [] if keep_sql else None
+        self.render_started = self.render_seconds = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_seconds += elapsed
+            if self.sql is not None and len(self.sql) < MAX_LOGGED_QUERIES:
+                self.sql.append((elapsed, sql))
+
+    def rendered(self, response):
+        self.render_seconds = time.perf_counter() - self.render_started
+
+    def wrap_connections(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = request._profile = RequestProfile(settings.PROFILING_SLOW_REQUEST_MS > 0)
+        with profile.wrap_connections():
+            response = self.get_response(request)
+        self.record(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        profile = request._profile = RequestProfile(settings.PROFILING_SLOW_REQUEST_MS > 0)
+        # Connections belong to the thread that sync_to_async runs the
+        # request's ORM calls in, so wrap them there
+        wrapped = await sync_to_async(profile.wrap_connections)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrapped.close)()
+        self.record(request, response, profile)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render after this, then run their post-render callbacks
+        profile = request._profile
+        profile.render_started = time.perf_counter()
+        response.add_post_render_callback(profile.rendered)
+        return response
+
+    def record(self, request, response, profile):
+        elapsed = time.perf_counter() - profile.started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        labels = (('view', view), ('method', request.method))
+
+        REQUESTS.inc(labels + (('status', response.status_code),))
+        REQUEST_SECONDS.observe(labels, elapsed)
+        DB_QUERIES.observe(labels, profile.queries)
+        DB_SECONDS.observe(labels, profile.db_seconds)
+        if profile.render_seconds is not None:
+            RENDER_SECONDS.observe(labels, profile.render_seconds)
+        if not response.streaming:
+            RESPONSE_BYTES.observe(labels, len(response.content))
+
+        if profile.sql is not None and elapsed * 1000 >= settings.PROFILING_SLOW_REQUEST_MS:
+            statements = '\n'.join(f'  {seconds * 1000:.1f}ms {sql}' for seconds, sql in profile.sql)
+            logger.warning(
+                "Slow request %s %s (%s): %.0fms, %s queries in %.0fms\n%s",
+                request.method, request.get_full_path(), view, elapsed * 1000,
+                profile.queries, profile.db_seconds * 1000, statements,
+            )
+
+
+def _queue_metrics():
+    stats = queue_stats()
+    yield '# HELP image_jobs Image jobs by status.'
+    yield '# TYPE image_jobs gauge'
+    for status in ('queued', 'running', 'failed'):
+        yield f'image_jobs{{status="{status}"}} {stats[status]}'
+    yield '# HELP image_job_oldest_queued_age_seconds Age of the oldest queued image job.'
+    yield '# TYPE image_job_oldest_queued_age_seconds gauge'
+    yield f'image_job_oldest_queued_age_seconds {stats["oldest_queued_age"]}'
+    for name, key in (('image_job_processing_seconds', 'processing'), ('image_job_end_to_end_seconds', 'end_to_end')):
+        yield f'# HELP {name} Image job latency over the last hour.'
+        yield f'# TYPE {name} summary'
+        for quantile, stat in (('0.5', 'p50'), ('0.95', 'p95')):
+            value = stats[f'{key}_{stat}']
+            yield f'{name}{{quantile="{quantile}"}} {"NaN" if value is None else value}'
+        yield f'{name}_count {stats["done"]}'
+
+
+def metrics(request):
+    """Prometheus text exposition of the request metrics and image queue"""
+    if not settings.PROFILING:
+        return HttpResponse(status=404)
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponseForbidden()
+    lines = [line for metric in METRICS for line in metric.collect()]
+    lines += _queue_metrics()
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,85 @@
+import json
+import re
+
+from .fts import fts_connection
+from .models import Recipe
+
+FTS_TABLE = 'api_recipe_fts'
+
+# Column weights for bm25(): a hit in the title counts most, then tags
+FTS_WEIGHTS = (10.0, 3.0, 1.0, 5.0)
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ''
+
+
+def parse_recipe(caption):
+    """
+    Pull the recipe fields out of a JSON caption as written by CreatePost.jsx.
+    Returns None for captions that aren't a recipe.
+    """
+    try:
+        data = json.loads(caption)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    ingredients = data.get('ingredients')
+    if not isinstance(ingredients, list):
+        ingredients = []
+    # Ingredients are {id, name, quantity, unit} objects, older posts may use plain strings
+    names = [i.get('name') if isinstance(i, dict) else i for i in ingredients]
+
+    tags = data.get('tags')
+    if isinstance(tags, str):
+        tags = [tags]
+    elif not isinstance(tags, list):
+        tags = []
+
+    return {
+        'title': _text(data.get('title'))[:255],
+        'ingredients': '\n'.join(_text(n) for n in names if _text(n)),
+        'instructions': _text(data.get('instructions')),
+        'tags': ' '.join(_text(t) for t in tags if _text(t))[:500],
+    }
+
+
+def index_recipe(post):
+    """Create or refresh the Recipe row for `post`; the FTS triggers follow along"""
+    fields = parse_recipe(post.caption)
+    if fields is None:
+        Recipe.objects.filter(post=post).delete()
+        return None
+    recipe, _ = Recipe.objects.update_or_create(post=post, defaults=fields)
+    return recipe
+
+
+def _match_expression(query):
+    # Quote every word so user input can't inject FTS syntax, and prefix-match
+    # each one so results show up while the user is still typing
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipe_ids(query, limit, offset=0):
+    """Post ids of the best matching recipes, best first"""
+    connection = fts_connection(Recipe, FTS_TABLE)
+    if connection is not None:
+        match = _match_expression(query)
+        if not match:
+            return []
+        weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, {weights}), rowid DESC LIMIT %s OFFSET %s",
+                [match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    # No FTS5 on this backend: a substring match on the title. A leading
+    # wildcard can't use the title index, so this scans every recipe
+    recipes = Recipe.objects.filter(title__icontains=query.strip()).order_by('-post_id')
+    return list(recipes.values_list('post_id', flat=True)[offset:offset + limit])
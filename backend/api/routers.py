@@ -0,0 +1,63 @@
+"""
+Read-replica routing.
+
+Reads go to a replica only inside views marked with @read_replica; everything
+else, including reads made while handling a write, stays on the primary so
+it never sees replica lag. Once a marked view writes, its remaining reads
+are pinned to the primary too. Replicas are configured in settings.DATABASES
+as `replica_0`, `replica_1`, ... (see DATABASE_REPLICA_HOSTS).
+"""
+import asyncio
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+def read_replica(view):
+    """Send the ORM reads made by `view` (sync or async) to a replica"""
+    if asyncio.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            token = _use_replica.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _use_replica.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if replicas and _use_replica.get():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        # A replica may not have this write yet, so read the rest of the view from the primary
+        _use_replica.set(False)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
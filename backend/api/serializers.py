@@ -1,5 +1,8 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from .models import MyUser, Post, Like, Comment
+from .follows import is_following
 
 class MyUserProfileSerializer(serializers.ModelSerializer):
 
@@ -15,18 +18,17 @@ class MyUserProfileSerializer(serializers.ModelSerializer):
         extra_kwargs = {"password": {"write_only": True}}
 
     def create(self, validated_data):
-        print(validated_data)
         user = MyUser.objects.create_user(**validated_data)
         return user
 
     def get_follower_count(self, obj):
-        return obj.followers.count()
+        return obj.follower_count
     
     def get_following_count(self, obj):
-        return obj.following.count()
+        return obj.following_count
     
     def get_posts_count(self, obj):
-        return obj.posts.count()
+        return obj.posts_count
         
     def get_profile_image(self, obj):
         if obj.profile_image and hasattr(obj.profile_image, 'url'):
@@ -34,11 +36,32 @@ class MyUserProfileSerializer(serializers.ModelSerializer):
         return None
         
     def get_is_following(self, obj):
+        # Views serializing many users resolve this up front with followed_usernames()
+        if 'following' in self.context:
+            return obj.pk in self.context['following']
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return request.user in obj.followers.all()
+            return is_following(request.user, obj)
         return False
 
+class MyUserSummarySerializer(serializers.ModelSerializer):
+    """Just enough to render a row in a follower/following list"""
+    profile_image = serializers.SerializerMethodField()
+    is_following = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MyUser
+        fields = ['username', 'profile_image', 'is_following']
+
+    def get_profile_image(self, obj):
+        if obj.profile_image and hasattr(obj.profile_image, 'url'):
+            return obj.profile_image.url
+        return None
+
+    def get_is_following(self, obj):
+        # Resolved for the whole page with followed_usernames()
+        return obj.pk in self.context.get('following', ())
+
 class UserRegisterSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -47,7 +70,6 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         extra_kwargs = {"password": {"write_only": True}}
 
     def create(self, validated_data):
-        print(validated_data)
         user = MyUser.objects.create_user(**validated_data)
         return user
 
@@ -71,17 +93,36 @@ class PostSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     likes_count = serializers.ReadOnlyField()
     comments_count = serializers.ReadOnlyField()
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField()
     liked_by_user = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
-        fields = ['id', 'username', 'image', 'caption', 'created_at', 
-                 'likes_count', 'comments_count', 'comments', 'liked_by_user']
-        read_only_fields = ['id', 'username', 'created_at', 'likes_count', 
-                           'comments_count', 'liked_by_user']
+        fields = ['id', 'username', 'image', 'image_status', 'image_width', 'image_height', 'image_srcset',
+                 'caption', 'created_at', 'likes_count', 'comments_count', 'comments', 'liked_by_user']
+        read_only_fields = ['id', 'username', 'image_status', 'image_width', 'image_height', 'created_at',
+                           'likes_count', 'comments_count', 'liked_by_user']
+    
+    def get_comments(self, obj):
+        """The latest few comments, oldest first; the rest come from posts/<id>/comments/"""
+        comments = getattr(obj, 'preview_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('user').order_by('-created_at', '-id')[:settings.COMMENT_PREVIEW_COUNT]
+        return CommentSerializer(reversed(list(comments)), many=True).data
+    
+    def get_image_srcset(self, obj):
+        """{variant name: url} for the re-encoded sizes of the image"""
+        request = self.context.get('request')
+        srcset = {}
+        for name, variant in obj.image_variants.items():
+            url = default_storage.url(variant['name'])
+            srcset[name] = request.build_absolute_uri(url) if request else url
+        return srcset
     
     def get_liked_by_user(self, obj):
+        if hasattr(obj, 'viewer_liked'):
+            return obj.viewer_liked
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Like.objects.filter(user=request.user, post=obj).exists()
@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_auth_users
+from .cache import invalidate_posts, invalidate_profiles
+from .events import author_channel, publish, publishing, user_channel
+from .models import MyUser, Post, Like, Comment
+from .serializers import CommentSerializer
+
+# Invalidation and live events run on commit so a concurrent read can't
+# re-cache the pre-commit state (counters are bumped after the row is
+# written), and so events carry the committed counter values. Events are
+# best-effort: robust=True logs a broker failure instead of failing the
+# request that already committed.
+
+
+@receiver([post_save, post_delete], sender=Like)
+@receiver([post_save, post_delete], sender=Comment)
+def post_activity_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_posts(instance.post_id))
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    def invalidate():
+        invalidate_posts(instance.pk)
+        invalidate_profiles(instance.user_id)
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=MyUser)
+def user_changed(sender, instance, **kwargs):
+    def invalidate():
+        invalidate_profiles(instance.pk)
+        invalidate_auth_users(instance.pk)
+    transaction.on_commit(invalidate)
+
+
+@receiver(m2m_changed, sender=MyUser.followers.through)
+def followers_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    usernames = [instance.pk, *(pk_set or ())]
+    transaction.on_commit(lambda: invalidate_profiles(*usernames))
+
+
+def _publish_post_activity(post_id, event):
+    """Publish a like/comment event to the post author's channel, with the post's counters"""
+    if not publishing():
+        return
+    post = Post.objects.filter(pk=post_id).values('user_id', 'likes_count', 'comments_count').first()
+    if post is not None:
+        publish(author_channel(post['user_id']), {
+            **event,
+            'post_id': post_id,
+            'likes_count': post['likes_count'],
+            'comments_count': post['comments_count'],
+        })
+
+
+@receiver(post_save, sender=Like)
+def like_added(sender, instance, created, **kwargs):
+    if created:
+        event = {'type': 'like', 'username': instance.user_id, 'liked': True}
+        transaction.on_commit(lambda: _publish_post_activity(instance.post_id, event), robust=True)
+
+
+@receiver(post_delete, sender=Like)
+def like_removed(sender, instance, **kwargs):
+    event = {'type': 'like', 'username': instance.user_id, 'liked': False}
+    transaction.on_commit(lambda: _publish_post_activity(instance.post_id, event), robust=True)
+
+
+@receiver(post_save, sender=Comment)
+def comment_added(sender, instance, created, **kwargs):
+    if created:
+        event = {'type': 'comment', 'comment': CommentSerializer(instance).data}
+        transaction.on_commit(lambda: _publish_post_activity(instance.post_id, event), robust=True)
+
+
+@receiver(post_save, sender=Post)
+def post_added(sender, instance, created, **kwargs):
+    if created:
+        event = {'type': 'post', 'post_id': instance.pk, 'username': instance.user_id}
+        transaction.on_commit(lambda: publish(author_channel(instance.user_id), event), robust=True)
+
+
+@receiver(m2m_changed, sender=MyUser.followers.through)
+def follow_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    # user.followers.add(x) means x follows user; x.following.add(user) arrives reversed
+    pairs = [(instance.pk, other) for other in pk_set] if reverse else [(other, instance.pk) for other in pk_set]
+    following = action == 'post_add'
+
+    def send():
+        if not publishing():
+            return
+        counts = dict(MyUser.objects.filter(pk__in={followee for _, followee in pairs})
+                      .values_list('pk', 'follower_count'))
+        for follower, followee in pairs:
+            event = {
+                'type': 'follow',
+                'follower': follower,
+                'followee': followee,
+                'following': following,
+                'follower_count': counts.get(followee),
+            }
+            publish(user_channel(follower), event)
+            publish(user_channel(followee), event)
+    transaction.on_commit(send, robust=True)
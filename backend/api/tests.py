@@ -1,3 +1,1303 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import random
+import re
+import shutil
+import tempfile
+import threading
+import warnings
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, router, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import profiling
+from .cache import PAYLOAD_VERSION, post_key, profile_key
+from .counters import find_drift, post_counter_expressions, repair, user_counter_expressions
+from .explore import update_ranks
+from .follows import MAX_FOLLOW_STATE_USERNAMES, Follow, add_follow, remove_follow
+from .images import encode_variants
+from .jobs import claim_next_job, enqueue_image, run_job
+from .likes import like_writer
+from .models import MyUser, Post, Like, Comment, ExploreRank, ImageJob, Recipe, TimelineBackfill, TimelineEntry, UserSearch
+from .recipes import index_recipe
+from .routers import read_replica, replica_aliases
+from .urls import urlpatterns
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'green').save(buffer, 'PNG')
+    return SimpleUploadedFile('dish.png', buffer.getvalue(), content_type='image/png')
+
+
+def seed(users=3, posts_per_user=3, comments_per_post=2):
+    """A small social graph: everyone follows everyone, with posts, likes and comments"""
+    people = [MyUser.objects.create_user(username=f'user{i}', password='pw', first_name=f'Cook{i}') for i in range(users)]
+    for person in people:
+        for other in people:
+            if other != person:
+                other.followers.add(person)
+    for person in people:
+        for i in range(posts_per_user):
+            caption = json.dumps({'title': f'Pasta {person.username} {i}', 'ingredients': [{'name': 'egg'}], 'instructions': 'Boil'})
+            post = Post.objects.create(user=person, image='post_images/dish.webp', caption=caption)
+            index_recipe(post)
+            for liker in people:
+                Like.objects.create(user=liker, post=post)
+            for j in range(comments_per_post):
+                Comment.objects.create(user=people[j % users], post=post, text=f'Yum {j}')
+    # Rows above were created directly, so bring the stored counters in line
+    repair(Post, post_counter_expressions())
+    repair(MyUser, user_counter_expressions())
+    update_ranks(full=True)
+    return people
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryPlanTests(TestCase):
+    """Every query the API issues must be answered from an index, never a full table scan"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.users = seed()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        self.post = Post.objects.filter(user=self.users[1]).first()
+
+    def full_scans(self, sql):
+        """Tables `sql` reads by scanning every row"""
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            details = [row[-1] for row in cursor.fetchall()]
+        tables = set(connection.introspection.table_names())
+        # "SCAN api_post" is a table scan, "SCAN api_post USING INDEX ..." is not
+        return [
+            match.group(1) for match in (re.match(r'SCAN (\w+)$', detail) for detail in details)
+            if match and match.group(1) in tables
+        ]
+
+    def assertNoFullScans(self, method, url, data=None, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, **kwargs)
+        self.assertLess(response.status_code, 400, f'{method.upper()} {url}: {response.data}')
+
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not re.match(r'\s*(SELECT|UPDATE|DELETE|INSERT)', sql, re.I) or 'sqlite_master' in sql:
+                continue
+            scans = self.full_scans(sql)
+            self.assertEqual(scans, [], f'{method.upper()} {url} scans {scans}:\n{sql}')
+
+    def test_read_endpoints(self):
+        username = self.users[1].username
+        for url in [
+            '/api/feed/',
+            '/api/explore/',
+            f'/api/user/{username}/posts/',
+            f'/api/user_data/{username}/',
+            f'/api/user/{username}/followers/',
+            f'/api/user/{username}/following/',
+            '/api/user/current/',
+            f'/api/posts/{self.post.id}/comments/',
+        ]:
+            self.assertNoFullScans('get', url)
+
+    def test_paginated_pages(self):
+        first = self.client.get('/api/feed/?page_size=2').data
+        self.assertNoFullScans('get', f"/api/feed/?page_size=2&cursor={first['next_cursor']}")
+        comments = self.client.get(f'/api/posts/{self.post.id}/comments/?page_size=1').data
+        self.assertNoFullScans('get', f"/api/posts/{self.post.id}/comments/?page_size=1&cursor={comments['next_cursor']}")
+
+    def test_search_endpoints(self):
+        self.assertNoFullScans('get', '/api/users/search/', {'query': 'user'})
+        self.assertNoFullScans('get', '/api/users/search/', {'query': 'cook1'})
+        self.assertNoFullScans('get', '/api/recipes/search/', {'query': 'pasta'})
+        self.assertNoFullScans('post', '/api/users/follow-state/', {'usernames': ['user1', 'user2']}, format='json')
+
+    def test_write_endpoints(self):
+        self.assertNoFullScans('post', f'/api/posts/{self.post.id}/like/')
+        self.assertNoFullScans('post', f'/api/posts/{self.post.id}/like/')
+        self.assertNoFullScans('post', f'/api/posts/{self.post.id}/comment/', {'text': 'Looks great'})
+        self.assertNoFullScans('post', f'/api/user/{self.users[1].username}/follow/')
+        self.assertNoFullScans('post', f'/api/user/{self.users[1].username}/follow/')
+        self.assertNoFullScans('post', '/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+
+    @override_settings(TIMELINE_FANOUT=True)
+    def test_timeline_feed(self):
+        self.assertNoFullScans('post', '/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        self.assertNoFullScans('post', f'/api/user/{self.users[1].username}/follow/')
+        self.assertNoFullScans('post', f'/api/user/{self.users[1].username}/follow/')
+        self.assertNoFullScans('get', '/api/feed/')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, LIKE_FLUSH_INTERVAL=0)
+class QueryCountTests(TestCase):
+    """
+    Every view issues the same number of queries however much data there is,
+    so an N+1 (a serializer field touching a relation per row, say) fails here
+    """
+
+    SMALL = {'users': 3, 'posts_per_user': 2, 'comments_per_post': 1}
+    # More posts than a feed page and more comments than a post preview
+    LARGE = {'users': 6, 'posts_per_user': 5, 'comments_per_post': 4}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def endpoints(self, users):
+        """name: (method, url, data, format), one per view in api/views.py"""
+        author = users[1].username
+        post = Post.objects.filter(user=users[1]).order_by('id').first().id
+        return {
+            'signup': ('post', '/api/user/signup/', {'username': 'newcook', 'password': 'pw'}, None),
+            'current_user': ('get', '/api/user/current/', None, None),
+            'user_profile': ('get', f'/api/user_data/{author}/', None, None),
+            'follow_user': ('post', f'/api/user/{author}/follow/', None, None),
+            'user_followers': ('get', f'/api/user/{author}/followers/', None, None),
+            'user_following': ('get', f'/api/user/{author}/following/', None, None),
+            'user_posts': ('get', f'/api/user/{author}/posts/', None, None),
+            'search_users': ('get', '/api/users/search/', {'query': 'cook'}, None),
+            'follow_state': ('post', '/api/users/follow-state/', {'usernames': [u.username for u in users]}, 'json'),
+            'feed': ('get', '/api/feed/', None, None),
+            # A page both datasets fill; a short one also reads the newest unranked posts
+            'explore': ('get', '/api/explore/', {'page_size': 5}, None),
+            'create_post': ('post', '/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, 'multipart'),
+            'search_recipes': ('get', '/api/recipes/search/', {'query': 'pasta'}, None),
+            'like_post': ('put', f'/api/posts/{post}/like/', None, None),
+            'add_comment': ('post', f'/api/posts/{post}/comment/', {'text': 'Looks great'}, None),
+            'post_comments': ('get', f'/api/posts/{post}/comments/', None, None),
+            'batch': ('post', '/api/batch/', {'operations': [
+                {'op': 'unlike', 'post_id': post},
+                {'op': 'comment', 'post_id': post, 'text': 'Yum'},
+                {'op': 'unfollow', 'username': author},
+            ]}, 'json'),
+        }
+
+    def count_queries(self, size):
+        """{name: SQL of each query} for every endpoint, on a fresh dataset of `size`"""
+        queries = {}
+        with transaction.atomic():
+            users = seed(**size)
+            client = APIClient()
+            client.force_authenticate(users[0])
+            for name, (method, url, data, format) in self.endpoints(users).items():
+                # Cold caches, so the queries behind the cached fragments count
+                cache.clear()
+                with CaptureQueriesContext(connection) as ctx:
+                    response = getattr(client, method)(url, data, format=format)
+                self.assertLess(response.status_code, 400, f'{name}: {response.data}')
+                queries[name] = [query['sql'] for query in ctx.captured_queries]
+            transaction.set_rollback(True)
+        return queries
+
+    def test_covers_every_view(self):
+        views = {pattern.name for pattern in urlpatterns if pattern.callback.__module__ == 'api.views'}
+        self.assertEqual(views, set(self.endpoints(seed()).keys()))
+
+    def test_query_counts_do_not_grow(self):
+        small = self.count_queries(self.SMALL)
+        large = self.count_queries(self.LARGE)
+        for name in small:
+            with self.subTest(name):
+                self.assertEqual(
+                    len(large[name]), len(small[name]),
+                    f'{name}: {len(small[name])} queries on the small dataset, {len(large[name])} on the large one:\n'
+                    + '\n'.join(large[name]),
+                )
+
+
+class AsyncViewTests(TestCase):
+    """The /api/async/ read endpoints return the same payloads as their sync twins"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = seed()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.users[0])}'}
+
+    async def test_matches_sync_views(self):
+        paths = [
+            'feed/?page_size=2', 'explore/', 'user/user1/posts/', 'user_data/user1/',
+            'users/search/?query=user', 'recipes/search/?query=pasta',
+        ]
+        for path in paths:
+            response = await AsyncClient().get('/api/async/' + path, headers=self.headers)
+            expected = await sync_to_async(self.client.get)('/api/' + path)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(json.loads(response.content), expected.json(), path)
+
+    async def test_errors(self):
+        response = await AsyncClient().get('/api/async/feed/')
+        self.assertEqual(response.status_code, 401)
+        response = await AsyncClient().get('/api/async/feed/?cursor=zz', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        response = await AsyncClient().post('/api/async/feed/', headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.users = seed()
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.users[0])}'}
+
+    def act(self, user, method, url, data=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            getattr(client, method)(url, data)
+
+    async def test_deltas(self):
+        response = await AsyncClient().get('/api/events/', headers=self.headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+
+        async def next_event():
+            chunk = await asyncio.wait_for(anext(stream), 5)
+            return json.loads(chunk.decode().removeprefix('data: '))
+
+        post = await Post.objects.filter(user=self.users[1]).afirst()
+        await sync_to_async(self.act)(self.users[2], 'post', f'/api/posts/{post.id}/like/')
+        event = await next_event()
+        self.assertEqual((event['type'], event['post_id'], event['likes_count']), ('like', post.id, 2))
+        # The frontend skips the viewer's own likes by username
+        self.assertEqual((event['username'], event['liked']), ('user2', False))
+
+        await sync_to_async(self.act)(self.users[2], 'post', f'/api/posts/{post.id}/comment/', {'text': 'Nice'})
+        event = await next_event()
+        self.assertEqual((event['type'], event['comments_count'], event['comment']['text']), ('comment', 3, 'Nice'))
+
+        # Unfollowing stops the author's events, following again resumes them
+        await sync_to_async(self.act)(self.users[0], 'post', '/api/user/user1/follow/')
+        event = await next_event()
+        self.assertEqual((event['type'], event['following']), ('follow', False))
+        await sync_to_async(self.act)(self.users[2], 'post', f'/api/posts/{post.id}/like/')
+        await sync_to_async(self.act)(self.users[0], 'post', '/api/user/user1/follow/')
+        event = await next_event()
+        self.assertEqual((event['type'], event['following']), ('follow', True))
+        # The like made while unfollowed never arrived, this unlike does
+        await sync_to_async(self.act)(self.users[2], 'post', f'/api/posts/{post.id}/like/')
+        event = await next_event()
+        self.assertEqual((event['type'], event['likes_count']), ('like', 2))
+        await stream.aclose()
+
+    def test_needs_asgi(self):
+        self.assertEqual(APIClient().get('/api/events/', headers=self.headers).status_code, 501)
+
+    def test_no_event_queries_without_listeners(self):
+        # Under WSGI nothing subscribes to the local broker, so events aren't built
+        post = Post.objects.filter(user=self.users[1]).first()
+        client = APIClient()
+        client.force_authenticate(self.users[2])
+        with self.captureOnCommitCallbacks() as callbacks:
+            client.post(f'/api/posts/{post.id}/comment/', {'text': 'Nice'})
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+
+
+@override_settings(LIKE_FLUSH_INTERVAL=0)
+class PayloadCacheTests(TestCase):
+    """Writes drop the cached fragments they change once they commit (api/signals.py)"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = seed()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        self.post = Post.objects.filter(user=self.users[1]).first()
+
+    def cached(self, key):
+        return cache.get(key, version=PAYLOAD_VERSION)
+
+    def write(self, user, method, url, key, data=None):
+        """Make a write as `user` and check it drops `key` on commit, not before"""
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertIsNotNone(self.cached(key))
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = getattr(client, method)(url, data)
+        self.assertLess(response.status_code, 400)
+        self.assertIsNotNone(self.cached(key))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(self.cached(key))
+
+    def post_data(self):
+        return {post['id']: post for post in self.client.get('/api/user/user1/posts/').data}[self.post.id]
+
+    def test_likes_and_comments(self):
+        self.assertEqual(self.post_data()['likes_count'], 3)
+        self.write(self.users[2], 'delete', f'/api/posts/{self.post.id}/like/', post_key(self.post.id))
+        self.assertEqual(self.post_data()['likes_count'], 2)
+
+        self.write(self.users[2], 'post', f'/api/posts/{self.post.id}/comment/', post_key(self.post.id), {'text': 'Nice'})
+        data = self.post_data()
+        self.assertEqual((data['comments_count'], data['comments'][-1]['text']), (3, 'Nice'))
+
+    def test_follows_and_profile_edits(self):
+        self.assertEqual(self.client.get('/api/user_data/user1/').data['follower_count'], 2)
+        self.write(self.users[0], 'post', '/api/user/user1/follow/', profile_key('user1'))
+        self.assertEqual(self.client.get('/api/user_data/user1/').data['follower_count'], 1)
+
+        self.client.get('/api/user_data/user1/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[1].bio = 'Pasta every day'
+            self.users[1].save()
+        self.assertIsNone(self.cached(profile_key('user1')))
+        self.assertEqual(self.client.get('/api/user_data/user1/').data['bio'], 'Pasta every day')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = seed()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        self.post = Post.objects.filter(user=self.users[1]).first()
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return self.client.get(url, headers={'If-None-Match': etag}), etag
+
+    def test_not_modified_until_a_change(self):
+        for url in ('/api/feed/', '/api/explore/', '/api/user/user1/posts/', '/api/user_data/user1/'):
+            response, etag = self.revalidate(url)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag)
+
+        # Someone else's like changes every payload showing the post
+        other = APIClient()
+        other.force_authenticate(self.users[2])
+        for url in ('/api/feed/', '/api/explore/', '/api/user/user1/posts/'):
+            etag = self.client.get(url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                other.post(f'/api/posts/{self.post.id}/like/')
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_explore_revalidation_is_two_queries(self):
+        # The page, then the state of its posts (a full page, so no unranked posts are read)
+        etag = self.client.get('/api/explore/?page_size=5')['ETag']
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/explore/?page_size=5', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_follows_the_database(self):
+        # Another worker's cache: the ETag doesn't depend on it
+        etag = self.client.get('/api/user/user1/posts/')['ETag']
+        cache.clear()
+        self.assertEqual(self.client.get('/api/user/user1/posts/', headers={'If-None-Match': etag}).status_code, 304)
+        # A change made elsewhere, with no invalidation here
+        Post.objects.filter(id=self.post.id).update(comments_count=F('comments_count') + 1)
+        response = self.client.get('/api/user/user1/posts/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_body_matches_the_etag(self):
+        # This process's fragments go stale behind the database's back
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.users[0])}')
+        for url in ('/api/user/user1/posts/', '/api/async/user/user1/posts/'):
+            self.client.get(url)
+            Post.objects.filter(id=self.post.id).update(comments_count=F('comments_count') + 1)
+            response = self.client.get(url)
+            comments_count = Post.objects.get(id=self.post.id).comments_count
+            self.assertEqual({p['id']: p['comments_count'] for p in response.json()}[self.post.id], comments_count, url)
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304, url)
+
+        self.client.get('/api/user_data/user1/')
+        MyUser.objects.filter(pk='user1').update(bio='Changed elsewhere')
+        response = self.client.get('/api/user_data/user1/')
+        self.assertEqual(response.data['bio'], 'Changed elsewhere')
+
+    def test_unfollow_changes_the_feed(self):
+        response = self.client.get('/api/feed/')
+        self.assertNotIn('Last-Modified', response)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/user/user1/follow/')
+        self.assertEqual(self.client.get('/api/feed/', headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+    def test_etag_is_per_viewer(self):
+        etag = self.client.get('/api/user_data/user1/')['ETag']
+        other = APIClient()
+        other.force_authenticate(self.users[2])
+        self.assertEqual(other.get('/api/user_data/user1/', headers={'If-None-Match': etag}).status_code, 200)
+
+
+class ReplicaRouterTests(TestCase):
+    @contextmanager
+    def replicas(self):
+        """settings.DATABASES with two test mirrors of the primary, as the PostgreSQL config sets up"""
+        databases = {**settings.DATABASES}
+        for i in range(2):
+            databases[f'replica_{i}'] = {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+        # Only the router reads the override; no connection is opened to the replicas
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            with override_settings(DATABASES=databases):
+                yield
+
+    def test_replicas_come_from_settings(self):
+        self.assertEqual(replica_aliases(), [])
+        with self.replicas():
+            self.assertEqual(replica_aliases(), ['replica_0', 'replica_1'])
+
+    def test_only_marked_views_read_from_replicas(self):
+        reads = read_replica(lambda: {router.db_for_read(Post) for _ in range(20)})
+        self.assertEqual(reads(), {'default'})
+        with self.replicas():
+            self.assertEqual(router.db_for_read(Post), 'default')
+            self.assertEqual(reads(), {'replica_0', 'replica_1'})
+            # Marked or not, writes go to the primary
+            self.assertEqual(read_replica(lambda: router.db_for_write(Post))(), 'default')
+            self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_marked_async_views_read_from_replicas(self):
+        async def view():
+            before = router.db_for_read(Post)
+            # ORM calls run in a worker thread; the pin has to come back from it
+            await sync_to_async(router.db_for_write)(Post)
+            return before, router.db_for_read(Post)
+
+        with self.replicas():
+            before, after = asyncio.run(read_replica(view)())
+            self.assertIn(before, {'replica_0', 'replica_1'})
+            self.assertEqual(after, 'default')
+
+    def test_reads_after_a_write_are_pinned_to_the_primary(self):
+        @read_replica
+        def view():
+            before = router.db_for_read(Post)
+            router.db_for_write(Post)
+            return before, router.db_for_read(Post)
+
+        with self.replicas():
+            before, after = view()
+            self.assertIn(before, {'replica_0', 'replica_1'})
+            self.assertEqual(after, 'default')
+            # The pin ends with the view
+            self.assertIn(view()[0], {'replica_0', 'replica_1'})
+
+    def test_migrations_only_run_on_the_primary(self):
+        self.assertTrue(router.allow_migrate('default', 'api'))
+        with self.replicas():
+            self.assertFalse(router.allow_migrate('replica_0', 'api'))
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = seed()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.users[0])}')
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in ctx.captured_queries if 'FROM "api_myuser"' in query['sql']]
+
+    def test_user_is_loaded_once(self):
+        self.assertEqual(len(self.user_queries('/api/explore/')), 1)
+        self.assertEqual(self.user_queries('/api/explore/'), [])
+
+    def test_deactivation_takes_effect(self):
+        self.client.get('/api/explore/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[0].is_active = False
+            self.users[0].save()
+        self.assertEqual(self.client.get('/api/explore/').status_code, 401)
+
+    def test_current_user_has_full_profile(self):
+        response = self.client.get('/api/user/current/')
+        self.assertEqual((response.data['username'], response.data['posts_count']), ('user0', 3))
+
+
+@override_settings(ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=1024, ARGON2_PARALLELISM=1, PBKDF2_ITERATIONS=1000)
+class PasswordRehashTests(TestCase):
+    def login(self, user):
+        response = APIClient().post('/api/token/', {'username': user.username, 'password': 'pw'})
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        return user.password
+
+    def test_upgraded_to_preferred_hasher_on_login(self):
+        with override_settings(PASSWORD_HASHERS=['api.hashers.PBKDF2PasswordHasher', 'api.hashers.Argon2PasswordHasher']):
+            user = MyUser.objects.create_user(username='old', password='pw')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(self.login(user).startswith('argon2$argon2id$v=19$m=1024,t=1,p=1$'))
+
+    def test_rehashed_when_work_factors_change(self):
+        user = MyUser.objects.create_user(username='old', password='pw')
+        with override_settings(ARGON2_TIME_COST=2):
+            self.assertIn('t=2', self.login(user))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ExploreRankTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = seed()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def explore_ids(self, page_size=20):
+        ids, cursor = [], None
+        while True:
+            params = {'page_size': page_size, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get('/api/explore/', params).data
+            ids += [post['id'] for post in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return ids
+
+    def test_pages_cover_every_post_once(self):
+        self.assertEqual(sorted(self.explore_ids(page_size=2)), sorted(Post.objects.values_list('id', flat=True)))
+
+    def test_empty_ranking_falls_back_to_the_newest_posts(self):
+        ExploreRank.objects.all().delete()
+        newest = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.explore_ids(), newest)
+        self.assertEqual(self.explore_ids(page_size=2), newest)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.users[0])}')
+        self.assertEqual([post['id'] for post in self.client.get('/api/async/explore/').json()['results']], newest)
+
+    def test_unranked_posts_follow_the_ranked_ones(self):
+        ranked = self.explore_ids()[:4]
+        ExploreRank.objects.exclude(post__in=ranked).delete()
+        rest = list(Post.objects.exclude(id__in=ranked).order_by('-created_at', '-id').values_list('id', flat=True))
+        # A page size of 2 ends the ranked posts exactly on a page boundary
+        for page_size in (2, 3, 20):
+            self.assertEqual(self.explore_ids(page_size=page_size), ranked + rest, page_size)
+
+    def test_authors_are_interleaved(self):
+        # Equal engagement everywhere, so only the diversity penalty separates posts
+        authors = [Post.objects.get(id=post_id).user_id for post_id in self.explore_ids()[:3]]
+        self.assertEqual(len(set(authors)), 3)
+
+    def test_only_changed_authors_are_rescored(self):
+        self.assertEqual(update_ranks(), (0, 0))
+        post = Post.objects.filter(user=self.users[1]).first()
+        Comment.objects.create(user=self.users[0], post=post, text='More')
+        Post.objects.filter(id=post.id).update(comments_count=F('comments_count') + 1)
+        self.assertEqual(update_ranks(), (3, 0))
+        self.assertEqual(self.explore_ids()[0], post.id)
+
+    def test_new_posts_show_up_immediately(self):
+        response = self.client.post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        # No engagement yet and three better posts by the same author, so it ranks last
+        self.assertEqual(self.explore_ids()[-1], response.data['id'])
+
+    def test_new_post_rescores_the_authors_other_posts(self):
+        # Older posts with no likes, so the new one outranks them and pushes their penalties up
+        older = timezone.now() - timedelta(days=3)
+        Post.objects.filter(user=self.users[0]).update(likes_count=0, comments_count=0, created_at=older)
+        update_ranks(full=True)
+        self.client.post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        scores = dict(ExploreRank.objects.values_list('post_id', 'score'))
+        self.assertEqual(update_ranks(), (0, 0))
+        update_ranks(full=True)
+        self.assertEqual(dict(ExploreRank.objects.values_list('post_id', 'score')), scores)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING='inline')
+class ImageProcessingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = MyUser.objects.create_user(username='chef', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_variants_replace_the_original(self):
+        response = self.client.post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(id=response.data['id'])
+        self.assertEqual((post.image_width, post.image_height), (64, 48))
+        self.assertTrue(default_storage.exists(post.image.name))
+
+    def stored_images(self):
+        return set(default_storage.listdir('post_images')[1]) if default_storage.exists('post_images') else set()
+
+    def test_only_the_variants_are_stored(self):
+        before = self.stored_images()
+        response = self.client.post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        post = Post.objects.get(id=response.data['id'])
+        added = {f'post_images/{name}' for name in self.stored_images() - before}
+        self.assertEqual(added, {variant['name'] for variant in post.image_variants.values()})
+
+    def test_encoding_happens_outside_the_transaction(self):
+        # TestCase's own atomic blocks are the baseline
+        baseline = len(connection.atomic_blocks)
+        depths = []
+
+        def encode(upload):
+            depths.append(len(connection.atomic_blocks))
+            return encode_variants(upload)
+
+        with mock.patch('api.views.encode_variants', encode):
+            self.client.post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        self.assertEqual(depths, [baseline])
+
+    def test_variants_are_deleted_on_rollback(self):
+        before = self.stored_images()
+        with mock.patch('api.views.rank_new_post', side_effect=RuntimeError('boom')):
+            response = self.client.post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(self.stored_images(), before)
+
+    def test_undecodable_upload_is_a_bad_request(self):
+        buffer = io.BytesIO()
+        Image.effect_noise((256, 256), 64).convert('RGB').save(buffer, 'JPEG')
+        # Passes the serializer's header check, fails when the pixels are decoded
+        data = buffer.getvalue()
+        truncated = SimpleUploadedFile('dish.jpg', data[:len(data) // 2], content_type='image/jpeg')
+        response = self.client.post('/api/posts/create/', {'image': truncated, 'caption': 'Toast'}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Could not read the image', response.data['error'])
+        self.assertFalse(Post.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_PROCESSING='queue', IMAGE_JOB_MAX_ATTEMPTS=3, IMAGE_JOB_TIMEOUT=300)
+class ImageJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = MyUser.objects.create_user(username='chef', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def run_failing(self):
+        with self.assertLogs('api.jobs', 'WARNING'):
+            self.assertFalse(run_job(claim_next_job()))
+
+    def missing_image_job(self):
+        # Reading the upload fails, the kind of error worth retrying
+        post = Post.objects.create(user=self.user, image='post_images/missing.png', caption='Toast')
+        return enqueue_image(post)
+
+    def test_upload_is_queued_then_processed(self):
+        response = self.client.post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        post = Post.objects.get(id=response.data['id'])
+        self.assertEqual(post.image_status, Post.IMAGE_PENDING)
+        job = ImageJob.objects.get(post=post)
+        self.assertEqual(job.status, ImageJob.QUEUED)
+
+        self.assertTrue(run_job(claim_next_job()))
+        job.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.DONE, 1))
+        self.assertEqual((post.image_status, post.image_width), (Post.IMAGE_READY, 64))
+        self.assertIsNone(claim_next_job())
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        job = self.missing_image_job()
+        for attempt in (1, 2):
+            started = timezone.now()
+            self.run_failing()
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (ImageJob.QUEUED, attempt))
+            self.assertGreaterEqual(job.run_after, started + timedelta(seconds=2 ** attempt))
+            # Not runnable until the backoff has passed
+            self.assertIsNone(claim_next_job())
+            ImageJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+        self.run_failing()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 3))
+        self.assertTrue(job.last_error)
+        self.assertEqual(Post.objects.get(pk=job.post_id).image_status, Post.IMAGE_FAILED)
+        self.assertIsNone(claim_next_job())
+
+    def test_undecodable_upload_fails_without_retrying(self):
+        post = Post.objects.create(
+            user=self.user, caption='Toast',
+            image=default_storage.save('post_images/dish.png', SimpleUploadedFile('dish.png', b'not an image')),
+        )
+        job = enqueue_image(post)
+        self.run_failing()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 1))
+
+    def test_stale_running_jobs_are_reclaimed(self):
+        job = self.missing_image_job()
+        self.assertEqual(claim_next_job().pk, job.pk)
+        # Still within the timeout, so nobody else takes it
+        self.assertIsNone(claim_next_job())
+
+        ImageJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(seconds=301))
+        reclaimed = claim_next_job()
+        self.assertEqual((reclaimed.pk, reclaimed.status, reclaimed.attempts), (job.pk, ImageJob.RUNNING, 2))
+
+    def queued_upload(self):
+        response = self.client.post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        return Post.objects.get(id=response.data['id'])
+
+    def test_encoding_happens_outside_the_transaction(self):
+        self.queued_upload()
+        baseline = len(connection.atomic_blocks)
+        depths = []
+
+        def encode(upload):
+            depths.append(len(connection.atomic_blocks))
+            return encode_variants(upload)
+
+        with mock.patch('api.jobs.encode_variants', encode):
+            self.assertTrue(run_job(claim_next_job()))
+        self.assertEqual(depths, [baseline])
+
+    def test_post_changed_during_the_encode_is_left_alone(self):
+        post = self.queued_upload()
+        written = []
+
+        def encode(upload):
+            # Someone else settles the post while we encode
+            Post.objects.filter(pk=post.pk).update(image_status=Post.IMAGE_FAILED)
+            written.append(encode_variants(upload))
+            return written[-1]
+
+        with mock.patch('api.jobs.encode_variants', encode):
+            self.assertFalse(run_job(claim_next_job()))
+        post.refresh_from_db()
+        self.assertEqual((post.image_status, post.image_variants), (Post.IMAGE_FAILED, {}))
+        self.assertTrue(default_storage.exists(post.image.name))
+        for variant in written[0].values():
+            self.assertFalse(default_storage.exists(variant['name']))
+
+    def test_post_deleted_during_the_encode(self):
+        post = self.queued_upload()
+
+        def encode(upload):
+            variants = encode_variants(upload)
+            Post.objects.filter(pk=post.pk).delete()
+            return variants
+
+        with mock.patch('api.jobs.encode_variants', encode):
+            self.assertFalse(run_job(claim_next_job()))
+        self.assertFalse(ImageJob.objects.exists())
+
+
+class FollowCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = MyUser.objects.create_user(username='chef', password='pw')
+        self.fan = MyUser.objects.create_user(username='fan', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def counts(self):
+        return (
+            MyUser.objects.get(pk=self.author.pk).follower_count,
+            MyUser.objects.get(pk=self.fan.pk).following_count,
+        )
+
+    def test_toggle_updates_counters(self):
+        self.assertEqual(self.client.post('/api/user/chef/follow/').data['status'], 'followed')
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(self.client.post('/api/user/chef/follow/').data['status'], 'unfollowed')
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_only_rows_actually_written_count(self):
+        self.assertTrue(add_follow(self.fan, self.author))
+        # A second insert, as from a racing request, hits the unique index
+        self.assertFalse(add_follow(self.fan, self.author))
+        self.assertTrue(remove_follow(self.fan, self.author))
+        self.assertFalse(remove_follow(self.fan, self.author))
+
+    def test_repair_counters(self):
+        self.client.post('/api/user/chef/follow/')
+        Post.objects.create(user=self.author, image='post_images/dish.webp', caption='Soup')
+        MyUser.objects.update(follower_count=7, following_count=7, posts_count=7)
+
+        out = io.StringIO()
+        call_command('repair_counters', '--dry-run', stdout=out)
+        self.assertIn('MyUser.follower_count: 2 row(s) out of date', out.getvalue())
+        self.assertEqual(self.counts(), (7, 7))
+
+        call_command('repair_counters', stdout=io.StringIO())
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(MyUser.objects.get(pk=self.author.pk).posts_count, 1)
+        self.assertEqual(find_drift(MyUser, user_counter_expressions()), {'follower_count': 0, 'following_count': 0, 'posts_count': 0})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, TIMELINE_FANOUT=True, TIMELINE_FANOUT_MAX_FOLLOWERS=2)
+class TimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = MyUser.objects.create_user(username='chef', password='pw')
+        self.fans = [MyUser.objects.create_user(username=f'fan{i}', password='pw') for i in range(3)]
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def toggle_follow(self, fan):
+        self.client_for(fan).post(f'/api/user/{self.author.pk}/follow/')
+
+    def post(self):
+        response = self.client_for(self.author).post('/api/posts/create/', {'image': make_image(), 'caption': 'Toast'}, format='multipart')
+        return response.data['id']
+
+    def feed(self, user):
+        return [post['id'] for post in self.client_for(user).get('/api/feed/').data['results']]
+
+    def entries(self, user):
+        return set(TimelineEntry.objects.filter(owner=user).values_list('post_id', flat=True))
+
+    def test_posts_fan_out_to_followers(self):
+        self.toggle_follow(self.fans[0])
+        post_id = self.post()
+        self.assertEqual(self.entries(self.fans[0]), {post_id})
+        self.assertEqual(self.entries(self.fans[1]), set())
+        self.assertEqual(self.feed(self.fans[0]), [post_id])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        post_id = self.post()
+        self.toggle_follow(self.fans[0])
+        self.assertEqual(self.entries(self.fans[0]), {post_id})
+        self.toggle_follow(self.fans[0])
+        self.assertEqual(self.entries(self.fans[0]), set())
+        self.assertEqual(self.feed(self.fans[0]), [])
+
+    def test_big_authors_are_merged_at_read_time(self):
+        for fan in self.fans:
+            self.toggle_follow(fan)
+        post_id = self.post()
+        self.assertEqual(self.entries(self.fans[0]), set())
+        self.assertEqual(self.feed(self.fans[0]), [post_id])
+
+    def test_author_dropping_to_the_threshold_stays_in_feeds(self):
+        for fan in self.fans:
+            self.toggle_follow(fan)
+        post_id = self.post()
+        self.toggle_follow(self.fans[2])
+        # The backfill is queued, not run by the unfollow; the feed merges the author meanwhile
+        self.assertEqual(self.entries(self.fans[0]), set())
+        self.assertEqual(self.feed(self.fans[0]), [post_id])
+
+        out = io.StringIO()
+        call_command('backfill_timelines', stdout=out)
+        self.assertIn('Backfilled 1 author(s)', out.getvalue())
+        self.assertFalse(TimelineBackfill.objects.exists())
+        self.assertEqual(self.entries(self.fans[0]), {post_id})
+        self.assertEqual(self.feed(self.fans[0]), [post_id])
+        self.assertEqual(self.feed(self.fans[1]), [post_id])
+        self.assertEqual(self.feed(self.fans[2]), [])
+
+    def test_batch_unfollow_backfills_too(self):
+        for fan in self.fans:
+            self.toggle_follow(fan)
+        post_id = self.post()
+        self.client_for(self.fans[2]).post('/api/batch/', {'operations': [{'op': 'unfollow', 'username': self.author.pk}]}, format='json')
+        self.assertEqual(list(TimelineBackfill.objects.values_list('author', flat=True)), [self.author.pk])
+        self.assertEqual(self.feed(self.fans[0]), [post_id])
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Alphabetical order is the reverse of popularity
+        self.users = [MyUser.objects.create_user(username=f'cook{i:02d}', password='pw') for i in range(12)]
+        for i, user in enumerate(self.users):
+            MyUser.objects.filter(pk=user.pk).update(follower_count=i)
+        MyUser.objects.create_user(username='cook', password='pw')
+        MyUser.objects.create_user(username='bookcook', password='pw', first_name='Ana')
+        self.viewer = MyUser.objects.create_user(username='viewer', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def search(self, query, page_size=5):
+        usernames, cursor = [], None
+        while True:
+            params = {'query': query, 'page_size': page_size, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get('/api/users/search/', params).data
+            usernames += [user['username'] for user in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                return usernames
+
+    def test_ranked_by_tier_then_followers(self):
+        expected = ['cook'] + [f'cook{i:02d}' for i in reversed(range(12))] + ['bookcook']
+        self.assertEqual(self.search('cook', page_size=100), expected)
+
+    def test_pages_cover_every_match_once(self):
+        self.assertEqual(self.search('cook', page_size=3), self.search('cook', page_size=100))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/users/search/', {'query': 'cook', 'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeSearchTests(TestCase):
+    def setUp(self):
+        self.user = MyUser.objects.create_user(username='chef', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.posts = {
+            name: self.recipe(**fields) for name, fields in [
+                ('title', {'title': 'Tomato soup'}),
+                ('tags', {'title': 'Summer salad', 'tags': ['tomato']}),
+                ('ingredients', {'title': 'Pasta bake', 'ingredients': [{'name': 'tomatoes'}]}),
+                ('instructions', {'title': 'Flatbread', 'instructions': 'Baked with sliced tomato'}),
+            ]
+        }
+        Post.objects.create(user=self.user, image='post_images/dish.webp', caption='Just a tomato')
+
+    def recipe(self, title, ingredients=(), instructions='', tags=()):
+        caption = json.dumps({'title': title, 'ingredients': list(ingredients), 'instructions': instructions, 'tags': list(tags)})
+        post = Post.objects.create(user=self.user, image='post_images/dish.webp', caption=caption)
+        index_recipe(post)
+        return post.id
+
+    def search(self, query, **params):
+        response = self.client.get('/api/recipes/search/', {'query': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']]
+
+    def test_ranked_by_where_the_words_match(self):
+        # Title, then tags, then ingredients, then instructions; plain captions aren't recipes
+        expected = [self.posts[name] for name in ('title', 'tags', 'ingredients', 'instructions')]
+        self.assertEqual(self.search('tomato'), expected)
+
+    def test_prefix_and_stemmed_matches(self):
+        self.assertEqual(len(self.search('tom')), 4)
+        self.assertEqual(self.search('tomatoes sou'), [self.posts['title']])
+        # Porter stemming: "baking" finds "bake" and "baked"
+        self.assertEqual(set(self.search('baking')), {self.posts['ingredients'], self.posts['instructions']})
+        self.assertEqual(self.search('"); DROP'), [])
+
+    def test_ties_go_to_the_newest_and_pages_follow(self):
+        twin = self.recipe('Tomato soup')
+        self.assertEqual(self.search('tomato soup'), [twin, self.posts['title']])
+        first = self.client.get('/api/recipes/search/', {'query': 'tomato', 'page_size': 3}).data
+        second = self.client.get('/api/recipes/search/', {'query': 'tomato', 'page_size': 3, 'page': 2}).data
+        self.assertEqual((first['next_page'], second['next_page']), (2, None))
+        self.assertEqual([post['id'] for post in first['results'] + second['results']], self.search('tomato'))
+
+
+class ListPagingTests(TestCase):
+    """Cursor pages of the list endpoints cover every row once, in order"""
+
+    def setUp(self):
+        self.users = seed()
+        self.fans = MyUser.objects.bulk_create([MyUser(username=f'fan{i}') for i in range(7)])
+        for fan in self.fans:
+            add_follow(fan, self.users[1])
+            add_follow(self.users[1], fan)
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def walk(self, url, page_size=3):
+        """Every item across the pages of `url`, and how many pages there were"""
+        items, cursor, pages = [], None, 0
+        while True:
+            params = {'page_size': page_size, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            items += response.data['results']
+            pages += 1
+            cursor = response.data['next_cursor']
+            if not cursor:
+                return items, pages
+
+    def test_followers_and_following(self):
+        for url, rows in (
+            ('/api/user/user1/followers/', Follow.objects.filter(from_myuser='user1').values_list('to_myuser', flat=True)),
+            ('/api/user/user1/following/', Follow.objects.filter(to_myuser='user1').values_list('from_myuser', flat=True)),
+        ):
+            items, pages = self.walk(url)
+            self.assertEqual([item['username'] for item in items], sorted(rows), url)
+            self.assertEqual(pages, 3, url)
+        # user0 follows user1 and user2 only
+        following = {item['username']: item['is_following'] for item in self.walk('/api/user/user1/followers/')[0]}
+        self.assertEqual(following['user2'], True)
+        self.assertEqual(following['fan0'], False)
+
+    def test_comments_with_equal_timestamps(self):
+        post = Post.objects.filter(user=self.users[1]).first()
+        Comment.objects.bulk_create([Comment(user=fan, post=post, text=f'Yum {fan.pk}') for fan in self.fans])
+        # Ties on created_at are broken by id, so none are skipped or repeated at a page boundary
+        Comment.objects.filter(post=post).update(created_at=timezone.now())
+        items, pages = self.walk(f'/api/posts/{post.id}/comments/')
+        self.assertEqual(
+            [item['id'] for item in items],
+            list(Comment.objects.filter(post=post).order_by('-id').values_list('id', flat=True)),
+        )
+        self.assertEqual(pages, 3)
+
+    def test_invalid_cursor(self):
+        for url in ('/api/user/user1/followers/', f'/api/posts/{Post.objects.first().id}/comments/'):
+            response = self.client.get(url, {'cursor': 'nope'})
+            self.assertEqual(response.status_code, 400, url)
+
+
+class FollowStateTests(TestCase):
+    def setUp(self):
+        self.users = seed()
+        MyUser.objects.create_user(username='stranger', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def follow_state(self, usernames):
+        return self.client.post('/api/users/follow-state/', {'usernames': usernames}, format='json')
+
+    def test_states(self):
+        response = self.follow_state(['user1', 'stranger', 'nobody', 'user0', 'user2'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'user1': True, 'stranger': False, 'nobody': False, 'user0': False, 'user2': True})
+        self.assertEqual(self.follow_state([]).data, {})
+
+    def test_one_query_however_many_usernames(self):
+        usernames = ['user1', 'user2'] + [f'cook{i}' for i in range(MAX_FOLLOW_STATE_USERNAMES - 2)]
+        with self.assertNumQueries(1):
+            response = self.follow_state(usernames)
+        self.assertEqual(sum(response.data.values()), 2)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.follow_state(['cook'] * (MAX_FOLLOW_STATE_USERNAMES + 1)).status_code, 400)
+        self.assertEqual(self.follow_state('user1').status_code, 400)
+        self.assertEqual(self.follow_state(['user1', 2]).status_code, 400)
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.users = seed()
+        extra = MyUser.objects.bulk_create([MyUser(username=f'new{i}') for i in range(20)])
+        self.users += extra
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        self.post = Post.objects.filter(user=self.users[1]).first()
+
+    def batch(self, operations):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/batch/', {'operations': operations}, format='json')
+
+    def test_mixed_operations(self):
+        response = self.batch([
+            {'op': 'unlike', 'post_id': self.post.id},
+            {'op': 'comment', 'post_id': self.post.id, 'text': ' First '},
+            {'op': 'comment', 'post_id': self.post.id, 'text': 'Second'},
+            {'op': 'unfollow', 'username': 'user1'},
+            {'op': 'follow', 'username': 'new0'},
+            {'op': 'follow', 'username': 'user0'},
+            {'op': 'follow', 'username': 'nobody'},
+            {'op': 'like', 'post_id': 0},
+            {'op': 'comment', 'post_id': self.post.id, 'text': ''},
+            {'op': 'poke'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([r.get('status') for r in results[:6]], ['unliked', 'commented', 'commented', 'unfollowed', 'followed', None])
+        self.assertEqual(results[1]['comment']['text'], 'First')
+        self.assertEqual([r.get('error') for r in results[5:]], [
+            'You cannot follow yourself', 'User not found', 'Post not found',
+            'Comment text cannot be empty', "Unknown op 'poke'",
+        ])
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (2, 4))
+        self.assertEqual(self.post.likes_count, self.post.likes.count())
+        counts = dict(MyUser.objects.values_list('username', 'follower_count'))
+        self.assertEqual((counts['user1'], counts['new0']), (1, 1))
+        self.assertEqual(MyUser.objects.get(pk='user0').following_count, 2)
+        self.assertEqual(list(self.users[0].following.order_by('pk').values_list('pk', flat=True)), ['new0', 'user2'])
+        # Caches saw the writes
+        profile = self.client.get('/api/user_data/user1/').data
+        self.assertEqual(profile['follower_count'], 1)
+
+        # Replaying the same batch changes nothing
+        self.batch([{'op': 'unlike', 'post_id': self.post.id}, {'op': 'follow', 'username': 'new0'}])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        self.assertEqual(MyUser.objects.get(pk='new0').follower_count, 1)
+
+    def test_query_count_is_flat(self):
+        def queries(usernames):
+            operations = [{'op': 'comment', 'post_id': self.post.id, 'text': 'Yum'} for _ in usernames]
+            operations += [{'op': 'like', 'post_id': post_id} for post_id in Post.objects.filter(user__in=usernames[:2]).values_list('id', flat=True)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.batch(operations).status_code, 200)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries(['new0', 'new1']), queries([f'new{i}' for i in range(2, 20)]))
+
+    def test_follows_written_concurrently_are_not_counted(self):
+        # Between the batch's read of the follow graph and its writes, another
+        # request follows new0 and unfollows user1 on user0's behalf
+        Follow.objects.create(from_myuser_id='new0', to_myuser_id='user0')
+        Follow.objects.filter(from_myuser='user1', to_myuser='user0').delete()
+        signals = []
+        m2m_changed.connect(lambda **kwargs: signals.append((kwargs['action'], kwargs['pk_set'])), sender=Follow, weak=False, dispatch_uid='batch-test')
+        self.addCleanup(m2m_changed.disconnect, sender=Follow, dispatch_uid='batch-test')
+        with mock.patch('api.batch.followed_usernames', return_value={'user1'}):
+            response = self.batch([
+                {'op': 'follow', 'username': 'new0'},
+                {'op': 'follow', 'username': 'new1'},
+                {'op': 'unfollow', 'username': 'user1'},
+            ])
+        self.assertEqual(response.status_code, 200)
+        counts = dict(MyUser.objects.values_list('username', 'follower_count'))
+        self.assertEqual((counts['new0'], counts['new1'], counts['user1']), (0, 1, 2))
+        self.assertEqual(MyUser.objects.get(pk='user0').following_count, 3)
+        self.assertEqual(signals, [('post_add', {'new1'})])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.batch('like').status_code, 400)
+        self.assertEqual(self.batch([{'op': 'poke'}] * 101).status_code, 400)
+
+
+@override_settings(PROFILING=True, PROFILING_SLOW_REQUEST_MS=0, METRICS_TOKEN='')
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = seed()
+        for metric in profiling.METRICS:
+            metric.clear()
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.users[0])}'}
+
+    def metric(self, text, name, **labels):
+        prefix = name + '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '} '
+        for line in text.splitlines():
+            if line.startswith(prefix):
+                return float(line[len(prefix):])
+        return None
+
+    def test_metrics(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/api/feed/')
+        self.assertEqual(response.status_code, 200)
+        queries = len(ctx)
+
+        text = APIClient().get('/metrics').content.decode()
+        self.assertEqual(self.metric(text, 'http_requests_total', view='feed', method='GET', status=200), 1)
+        self.assertEqual(self.metric(text, 'http_request_db_queries_sum', view='feed', method='GET'), queries)
+        self.assertEqual(self.metric(text, 'http_response_size_bytes_sum', view='feed', method='GET'), len(response.content))
+        self.assertEqual(self.metric(text, 'http_response_render_seconds_count', view='feed', method='GET'), 1)
+        self.assertEqual(self.metric(text, 'image_jobs', status='queued'), 0)
+
+    async def test_async_views(self):
+        response = await AsyncClient().get('/api/async/feed/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        text = (await AsyncClient().get('/metrics')).content.decode()
+        self.assertGreater(self.metric(text, 'http_request_db_queries_sum', view='async_feed', method='GET'), 0)
+
+    @override_settings(PROFILING_SLOW_REQUEST_MS=0.001)
+    def test_slow_request_log(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        with self.assertLogs('api.profiling', 'WARNING') as logs:
+            client.get('/api/feed/')
+        self.assertIn('Slow request GET /api/feed/ (feed)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 403)
+        self.assertEqual(APIClient().get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code, 200)
+
+    @override_settings(PROFILING=False)
+    def test_off(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 404)
+
+
+class BenchmarkToolTests(TestCase):
+    def test_generate_and_bench(self):
+        call_command('generate_data', users=40, posts_per_user=2, follows_per_user=5, days=7, seed=1, stdout=io.StringIO())
+        users = MyUser.objects.count()
+        self.assertEqual(users, 40)
+        self.assertEqual(UserSearch.objects.count(), users)
+        self.assertEqual(Recipe.objects.count(), Post.objects.count())
+        self.assertEqual(ExploreRank.objects.count(), Post.objects.count())
+        for model, expressions in ((Post, post_counter_expressions()), (MyUser, user_counter_expressions())):
+            self.assertFalse(any(find_drift(model, expressions).values()))
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as baseline:
+            call_command('bench_endpoints', requests=2, warmup=0, save=baseline.name, stdout=io.StringIO())
+            self.assertIn('feed', json.load(open(baseline.name))['endpoints'])
+            out = io.StringIO()
+            call_command('bench_endpoints', 'feed', requests=2, warmup=0, compare=baseline.name, threshold=100, stdout=out)
+            self.assertIn('No regressions', out.getvalue())
+        # Writes were rolled back
+        self.assertEqual(Post.objects.count(), Recipe.objects.count())
+        self.assertFalse(Comment.objects.filter(text='Benchmark comment').exists())
+
+
+class ConcurrentLikeTests(TransactionTestCase):
+    """Parallel clients liking and unliking the same posts end with exact rows and counters"""
+
+    CLIENTS = 8
+    REQUESTS = 40
+
+    def setUp(self):
+        cache.clear()
+        self.users = MyUser.objects.bulk_create([MyUser(username=f'fan{i}') for i in range(self.CLIENTS)])
+        author = MyUser.objects.create(username='chef')
+        self.posts = [Post.objects.create(user=author, image='post_images/dish.webp', caption='Soup') for _ in range(3)]
+
+    def hammer(self):
+        errors = []
+        final = {}
+
+        def client_thread(user, seed):
+            rng = random.Random(seed)
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                for _ in range(self.REQUESTS):
+                    post = rng.choice(self.posts)
+                    liked = rng.random() < 0.6
+                    response = (client.put if liked else client.delete)(f'/api/posts/{post.id}/like/')
+                    if response.status_code not in (200, 202):
+                        errors.append((response.status_code, response.data))
+                    final[(user.username, post.id)] = liked
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=client_thread, args=(user, i)) for i, user in enumerate(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        like_writer.flush()
+
+        self.assertEqual(errors, [])
+        expected = {key for key, liked in final.items() if liked}
+        self.assertEqual(set(Like.objects.values_list('user_id', 'post_id')), expected)
+        for post in Post.objects.all():
+            self.assertEqual(post.likes_count, sum(1 for _, post_id in expected if post_id == post.id))
+
+    @override_settings(LIKE_FLUSH_INTERVAL=0.01)
+    def test_buffered_writes(self):
+        self.hammer()
+
+    @override_settings(LIKE_FLUSH_INTERVAL=0)
+    def test_direct_writes(self):
+        self.hammer()
@@ -0,0 +1,138 @@
+"""
+Materialized home timelines (fan-out-on-write), switched on by settings.TIMELINE_FANOUT.
+
+create_post copies each new post into the timelines of the author and their
+followers, and follow_user backfills or prunes when the follow graph changes.
+Authors with more than TIMELINE_FANOUT_MAX_FOLLOWERS followers are never
+fanned out; their posts are merged in when the feed is read instead. When
+an unfollow takes an author back down to the threshold their posts stop
+being merged in, so their recent posts are copied to every follower by
+`python manage.py backfill_timelines`; until then they are still merged in.
+
+After turning the setting on, or after changing the threshold, run
+`python manage.py rebuild_timelines` to bring existing timelines up to date.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from .follows import Follow
+from .models import MyUser, Post, TimelineBackfill, TimelineEntry
+from .pagination import apply_cursor, encode_cursor, get_page_size
+
+
+# Followers per bulk insert when backfilling an author's posts to all of them
+BACKFILL_OWNERS_BATCH = 500
+
+
+def is_fanout_author(user):
+    return user.follower_count <= settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def _deliver(owner_ids, posts):
+    """Insert one entry per (owner, post), skipping ones that already exist"""
+    entries = [
+        TimelineEntry(owner_id=owner_id, post_id=post_id, created_at=created_at)
+        for owner_id in owner_ids
+        for post_id, created_at in posts
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    owner_ids = [post.user_id]
+    # Not post.user, which is request.user and may come with cached counters
+    author = MyUser.objects.only('follower_count').get(pk=post.user_id)
+    if is_fanout_author(author):
+        # user.followers.add(x) stores (from_myuser=user, to_myuser=x)
+        owner_ids += MyUser.followers.through.objects.filter(
+            from_myuser=post.user_id
+        ).values_list('to_myuser', flat=True)
+    _deliver(owner_ids, [(post.id, post.created_at)])
+
+
+def backfill_timeline(owner, author):
+    """`owner` just followed `author`: copy in the author's recent posts"""
+    if not is_fanout_author(author):
+        return
+    posts = Post.objects.filter(user=author).order_by('-created_at').values_list('id', 'created_at')
+    _deliver([owner.pk], posts[:settings.TIMELINE_BACKFILL_POSTS])
+
+
+def prune_timeline(owner, author):
+    """`owner` just unfollowed `author`: drop the author's posts"""
+    TimelineEntry.objects.filter(owner=owner, post__user=author).delete()
+
+
+def queue_shrunk_authors(author_ids):
+    """
+    Call after removing one follower from each of `author_ids` and updating
+    their follower_count: authors now exactly at the threshold were just
+    crossing it, so queue a backfill of their recent posts to every follower.
+    Until run_backfills() gets to it the feed keeps merging them in at read
+    time, so the request doesn't have to copy posts to every follower.
+    """
+    crossed = MyUser.objects.filter(pk__in=author_ids, follower_count=settings.TIMELINE_FANOUT_MAX_FOLLOWERS)
+    TimelineBackfill.objects.bulk_create(
+        [TimelineBackfill(author_id=author_id) for author_id in crossed.values_list('pk', flat=True)],
+        ignore_conflicts=True,
+    )
+
+
+def run_backfills():
+    """Deliver every queued author's recent posts to their followers. Returns how many authors were done"""
+    done = 0
+    for backfill in TimelineBackfill.objects.select_related('author').order_by('created_at'):
+        # Authors who grew past the threshold again are still merged in at read time
+        if is_fanout_author(backfill.author):
+            posts = list(Post.objects.filter(user=backfill.author_id).order_by('-created_at').values_list('id', 'created_at')[
+                :settings.TIMELINE_BACKFILL_POSTS
+            ])
+            followers = list(Follow.objects.filter(from_myuser=backfill.author_id).values_list('to_myuser', flat=True))
+            # Each batch commits on its own, keeping the write lock short;
+            # _deliver skips existing entries, so an interrupted run can start over
+            for start in range(0, len(followers), BACKFILL_OWNERS_BATCH):
+                _deliver(followers[start:start + BACKFILL_OWNERS_BATCH], posts)
+        backfill.delete()
+        done += 1
+    return done
+
+
+def rebuild_timeline(owner):
+    TimelineEntry.objects.filter(owner=owner).delete()
+    _deliver([owner.pk], Post.objects.filter(user=owner).values_list('id', 'created_at'))
+    for author in owner.following.all():
+        backfill_timeline(owner, author)
+
+
+def get_timeline_page(user, request):
+    """
+    One page of `user`'s home feed as (post ids newest first, next_cursor).
+
+    Cursors have the same (created_at, post id) shape as the fan-out-on-read
+    feed, so clients don't notice when the setting is flipped.
+    """
+    page_size = get_page_size(request)
+    cursor = request.query_params.get('cursor')
+
+    entries = TimelineEntry.objects.filter(owner=user)
+    if cursor:
+        entries = apply_cursor(entries, cursor, key='post_id')
+    keys = list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:page_size + 1])
+
+    # Fan-out-on-read for the few followed authors too big to fan out, and
+    # for those whose backfill is still queued
+    big_authors = user.following.filter(
+        Q(follower_count__gt=settings.TIMELINE_FANOUT_MAX_FOLLOWERS) | Q(timeline_backfill__isnull=False)
+    )
+    pulled = Post.objects.filter(user__in=big_authors)
+    if cursor:
+        pulled = apply_cursor(pulled, cursor)
+    keys += pulled.order_by('-created_at', '-id').values_list('created_at', 'id')[:page_size + 1]
+
+    # An author who crossed the threshold can show up from both sides
+    keys = sorted(set(keys), reverse=True)
+    next_cursor = None
+    if len(keys) > page_size:
+        keys = keys[:page_size]
+        next_cursor = encode_cursor(*keys[-1])
+    return [post_id for _, post_id in keys], next_cursor
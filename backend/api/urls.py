@@ -7,13 +7,18 @@ from api.views import (
     get_user_posts,
     like_post,
     add_comment,
+    get_post_comments,
     follow_user,
     explore,
     search_users,
+    get_follow_state,
     get_user_followers,
+    get_user_following,
     search_recipes,
     get_current_user,
+    batch,
 )
+from api import async_views
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
@@ -27,8 +32,10 @@ urlpatterns = [
     path('user_data/<str:pk>/', get_user_profile_data, name="user_profile"),
     path('user/<str:username>/follow/', follow_user, name="follow_user"),
     path('user/<str:username>/followers/', get_user_followers, name="user_followers"),
+    path('user/<str:username>/following/', get_user_following, name="user_following"),
     path('user/<str:username>/posts/', get_user_posts, name="user_posts"),
     path('users/search/', search_users, name="search_users"),
+    path('users/follow-state/', get_follow_state, name="follow_state"),
     
     # Posts and feed
     path('feed/', get_feed, name="feed"),
@@ -39,4 +46,17 @@ urlpatterns = [
     # Post interactions
     path('posts/<int:post_id>/like/', like_post, name="like_post"),
     path('posts/<int:post_id>/comment/', add_comment, name="add_comment"),
+    path('posts/<int:post_id>/comments/', get_post_comments, name="post_comments"),
+    path('batch/', batch, name="batch"),
+    
+    # Async (ASGI) versions of the read endpoints, see api/async_views.py
+    path('async/feed/', async_views.get_feed, name="async_feed"),
+    path('async/explore/', async_views.explore, name="async_explore"),
+    path('async/user/<str:username>/posts/', async_views.get_user_posts, name="async_user_posts"),
+    path('async/user_data/<str:pk>/', async_views.get_user_profile_data, name="async_user_profile"),
+    path('async/users/search/', async_views.search_users, name="async_search_users"),
+    path('async/recipes/search/', async_views.search_recipes, name="async_search_recipes"),
+
+    # Live likes/comments/posts/follows as Server-Sent Events (ASGI only)
+    path('events/', async_views.event_stream, name="events"),
 ]
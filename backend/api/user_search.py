@@ -0,0 +1,77 @@
+"""
+Ranked user search over the UserSearch side table.
+
+Matches are tiered: exact username, then a prefix of the username, first or
+last name (index range scans), then substrings anywhere (FTS5 trigram table
+on SQLite). Within a tier, users with more followers come first. Tiers,
+ordering and paging all happen in SQL, so every match is ranked, not just
+the first few rows of each index.
+"""
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from .fts import fts_connection
+from .models import UserSearch
+from .pagination import decode_search_cursor, encode_search_cursor
+
+FTS_TABLE = 'api_usersearch_fts'
+
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+
+# Trigram tokenizer can't match anything shorter
+MIN_SUBSTRING_LENGTH = 3
+
+
+def _prefix(query):
+    # Range lookups rather than LIKE so the column indexes are used
+    q = Q()
+    for field in UserSearch.SOURCE_FIELDS:
+        q |= Q(**{f'{field}__gte': query, f'{field}__lt': query + '\U0010ffff'})
+    return q
+
+
+def _substring(query):
+    if fts_connection(UserSearch, FTS_TABLE) is None:
+        q = Q()
+        for field in UserSearch.SOURCE_FIELDS:
+            q |= Q(**{f'{field}__contains': query})
+        return q
+    if len(query) < MIN_SUBSTRING_LENGTH:
+        return None
+    phrase = '"' + query.replace('"', '""') + '"'
+    return Q(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [phrase]))
+
+
+def search_usernames(query, limit, cursor=None, exclude=None):
+    """
+    Usernames matching `query`, best first, ordered by (tier, -follower_count,
+    username) in one query. Returns (usernames, next_cursor); pass the cursor
+    back for the next page.
+    """
+    query = query.strip().lower()
+    if not query:
+        return [], None
+
+    prefix, substring = _prefix(query), _substring(query)
+    matches = UserSearch.objects.filter(prefix | substring if substring is not None else prefix).annotate(
+        tier=Case(
+            When(username=query, then=Value(EXACT)),
+            When(prefix, then=Value(PREFIX)),
+            default=Value(SUBSTRING),
+        ),
+        follower_count=F('user__follower_count'),
+    )
+    if exclude:
+        matches = matches.exclude(user_id=exclude)
+    if cursor:
+        tier, followers, username = decode_search_cursor(cursor)
+        matches = matches.filter(
+            Q(tier__gt=tier)
+            | Q(tier=tier, follower_count__lt=followers)
+            | Q(tier=tier, follower_count=followers, user_id__gt=username)
+        )
+
+    rows = list(matches.order_by('tier', '-follower_count', 'user_id').values_list(
+        'tier', 'follower_count', 'user_id')[:limit + 1])
+    next_cursor = encode_search_cursor(*rows[limit - 1]) if len(rows) > limit else None
+    return [username for _, _, username in rows[:limit]], next_cursor
@@ -6,6 +6,7 @@ from .models import MyUser, Post, Like, Comment
 from .serializers import (
     UserRegisterSerializer, 
     MyUserProfileSerializer,
+    MyUserSummarySerializer,
     PostSerializer,
     PostCreateSerializer,
     CommentSerializer,
@@ -13,8 +14,22 @@ from .serializers import (
 )
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Q
-import json
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, F
+from .routers import read_replica
+from .pagination import paginate_queryset, paginate_by_key, get_page_size, InvalidCursor
+from .recipes import index_recipe, search_recipe_ids
+from .user_search import search_usernames
+from .timeline import fan_out_post, backfill_timeline, queue_shrunk_authors, prune_timeline, get_timeline_page
+from .explore import explore_page, rank_new_post
+from .cache import render_posts, render_profile
+from .conditional import posts_conditional, profile_conditional
+from .images import InvalidImage, delete_variants, encode_variants, variant_fields
+from .jobs import enqueue_image
+from .likes import apply_likes, like_writer
+from .batch import apply_batch, InvalidBatch
+from .follows import Follow, add_follow, remove_follow, followed_usernames, MAX_FOLLOW_STATE_USERNAMES
 
 # Create your views here.
 class CreateUserView(generics.CreateAPIView):
@@ -24,49 +39,69 @@ class CreateUserView(generics.CreateAPIView):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
 def get_user_profile_data(request, pk):
     try:
-        try:
-            user = MyUser.objects.get(username=pk)
-        except MyUser.DoesNotExist:
+        not_modified, headers, state = profile_conditional(request, pk)
+        if not_modified:
+            return not_modified
+
+        data = render_profile(pk, request, state=state)
+        if data is None:
             return Response({'error':'user does not exist'}, status=status.HTTP_404_NOT_FOUND)
         
-        serializer = MyUserProfileSerializer(user, many=False, context={'request': request})
-        return Response(serializer.data)
+        return Response(data, headers=headers)
     except Exception as e:
         return Response({'error':str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
 def search_users(request):
-    """Search for users by username"""
+    """Search for users by username or name"""
     try:
         query = request.query_params.get('query', '')
         if not query:
-            return Response([])
+            return Response({'results': [], 'next_cursor': None})
         
-        users = MyUser.objects.filter(
-            Q(username__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query)
-        ).exclude(username=request.user.username)[:10]  # Limit to 10 results
+        page_size = get_page_size(request, default=10, maximum=50)
+        # Ranked and paged in the user search index
+        usernames, next_cursor = search_usernames(query, limit=page_size, cursor=request.query_params.get('cursor'),
+                                                  exclude=request.user.username)
         
-        serializer = MyUserProfileSerializer(users, many=True)
-        return Response(serializer.data)
+        users = MyUser.objects.in_bulk(usernames)
+        users = [users[username] for username in usernames if username in users]
+        following = followed_usernames(request.user, usernames)
+        serializer = MyUserProfileSerializer(users, many=True, context={'request': request, 'following': following})
+        return Response({'results': serializer.data, 'next_cursor': next_cursor})
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
 def get_feed(request):
     try:
-        # Get posts from users the current user follows and their own posts
-        following = request.user.following.all()
-        posts = Post.objects.filter(user__in=following) | Post.objects.filter(user=request.user)
-        posts = posts.order_by('-created_at')
-        
-        serializer = PostSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        if settings.TIMELINE_FANOUT:
+            # Read the precomputed timeline
+            post_ids, next_cursor = get_timeline_page(request.user, request)
+        else:
+            # Get posts from users the current user follows and their own posts
+            following = request.user.following.all()
+            posts = Post.objects.filter(
+                Q(user__in=following) | Q(user=request.user)
+            ).only('id', 'created_at')
+            posts, next_cursor = paginate_queryset(posts, request)
+            post_ids = [post.id for post in posts]
+
+        not_modified, headers, states = posts_conditional(request, post_ids)
+        if not_modified:
+            return not_modified
+        return Response({'results': render_posts(post_ids, request, states), 'next_cursor': next_cursor}, headers=headers)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -76,34 +111,71 @@ def create_post(request):
     try:
         serializer = PostCreateSerializer(data=request.data)
         if serializer.is_valid():
-            post = serializer.save(user=request.user)
+            variants = None
+            fields = {}
+            if settings.IMAGE_PROCESSING != 'queue':
+                # Encoded before the transaction, which would otherwise hold the
+                # write lock for the seconds a large photo takes; only the
+                # variants are stored, never the original upload
+                variants = encode_variants(serializer.validated_data['image'])
+                fields = variant_fields(variants)
+            try:
+                with transaction.atomic():
+                    post = serializer.save(user=request.user, **fields)
+                    if variants is None:
+                        # Picked up by `manage.py process_images`
+                        enqueue_image(post)
+                    index_recipe(post)
+                    rank_new_post(post)
+                    if settings.TIMELINE_FANOUT:
+                        fan_out_post(post)
+                    MyUser.objects.filter(pk=request.user.pk).update(posts_count=F('posts_count') + 1)
+            except Exception:
+                if variants:
+                    delete_variants(variants)
+                raise
             return Response(PostSerializer(post, context={'request': request}).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    except InvalidImage as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
+@read_replica
 def get_user_posts(request, username):
     try:
         user = get_object_or_404(MyUser, username=username)
-        posts = Post.objects.filter(user=user).order_by('-created_at')
-        serializer = PostSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        post_ids = list(Post.objects.filter(user=user).order_by('-created_at').values_list('id', flat=True))
+        not_modified, headers, states = posts_conditional(request, post_ids)
+        if not_modified:
+            return not_modified
+        return Response(render_posts(post_ids, request, states), headers=headers)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['POST'])
+@api_view(['POST', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def like_post(request, post_id):
+    """PUT likes the post and DELETE unlikes it, whatever the current state; POST toggles"""
     try:
+        if request.method != 'POST':
+            if not Post.objects.filter(id=post_id).exists():
+                return Response({'error': 'Post not found'}, status=status.HTTP_404_NOT_FOUND)
+            liked = request.method == 'PUT'
+            buffered = like_writer.set(request.user.pk, post_id, liked)
+            return Response(
+                {'status': 'liked' if liked else 'unliked'},
+                status=status.HTTP_202_ACCEPTED if buffered else status.HTTP_200_OK,
+            )
+
         post = get_object_or_404(Post, id=post_id)
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-        
-        if not created:
+        if Like.objects.filter(user=request.user, post=post).exists():
             # User already liked this post, so unlike it
-            like.delete()
+            apply_likes({(request.user.pk, post.id): False})
             return Response({'status': 'unliked'}, status=status.HTTP_200_OK)
-        
+
+        apply_likes({(request.user.pk, post.id): True})
         return Response({'status': 'liked'}, status=status.HTTP_201_CREATED)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -118,12 +190,32 @@ def add_comment(request, post_id):
         if not text:
             return Response({'error': 'Comment text cannot be empty'}, status=status.HTTP_400_BAD_REQUEST)
         
-        comment = Comment.objects.create(user=request.user, post=post, text=text)
+        with transaction.atomic():
+            comment = Comment.objects.create(user=request.user, post=post, text=text)
+            Post.objects.filter(id=post.id).update(comments_count=F('comments_count') + 1)
         serializer = CommentSerializer(comment)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_replica
+def get_post_comments(request, post_id):
+    """Get a page of comments on a post, newest first"""
+    try:
+        if not Post.objects.filter(id=post_id).exists():
+            return Response({'error': 'post does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        
+        comments = Comment.objects.filter(post_id=post_id).select_related('user')
+        comments, next_cursor = paginate_queryset(comments, request)
+        serializer = CommentSerializer(comments, many=True)
+        return Response({'results': serializer.data, 'next_cursor': next_cursor})
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def follow_user(request, username):
@@ -133,70 +225,104 @@ def follow_user(request, username):
         if request.user == user_to_follow:
             return Response({'error': 'You cannot follow yourself'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if request.user in user_to_follow.followers.all():
-            # Unfollow
-            user_to_follow.followers.remove(request.user)
-            return Response({'status': 'unfollowed'}, status=status.HTTP_200_OK)
-        else:
-            # Follow
-            user_to_follow.followers.add(request.user)
-            return Response({'status': 'followed'}, status=status.HTTP_200_OK)
+        with transaction.atomic():
+            # Toggle, counting only the row this request actually deleted or
+            # inserted, so concurrent requests can't double count
+            if remove_follow(request.user, user_to_follow):
+                delta, result = -1, 'unfollowed'
+                if settings.TIMELINE_FANOUT:
+                    prune_timeline(request.user, user_to_follow)
+            else:
+                delta = 1 if add_follow(request.user, user_to_follow) else 0
+                result = 'followed'
+                if delta and settings.TIMELINE_FANOUT:
+                    backfill_timeline(request.user, user_to_follow)
+            if delta:
+                MyUser.objects.filter(pk=user_to_follow.pk).update(follower_count=F('follower_count') + delta)
+                MyUser.objects.filter(pk=request.user.pk).update(following_count=F('following_count') + delta)
+            if settings.TIMELINE_FANOUT and delta < 0:
+                queue_shrunk_authors([user_to_follow.pk])
+        return Response({'status': result}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _user_list_response(request, usernames, next_cursor):
+    """Slim rows for `usernames` (in order) with is_following, in two queries"""
+    users = MyUser.objects.only('username', 'profile_image').in_bulk(usernames)
+    following = followed_usernames(request.user, usernames)
+    users = [users[username] for username in usernames if username in users]
+    serializer = MyUserSummarySerializer(users, many=True, context={'request': request, 'following': following})
+    return Response({'results': serializer.data, 'next_cursor': next_cursor})
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
 def get_user_followers(request, username):
-    """Get a list of users who follow the specified user"""
+    """Get a page of users who follow the specified user"""
+    try:
+        user = get_object_or_404(MyUser, username=username)
+        # user.followers.add(x) stores (from_myuser=user, to_myuser=x)
+        usernames = Follow.objects.filter(from_myuser=user).values_list('to_myuser', flat=True)
+        usernames, next_cursor = paginate_by_key(usernames, request, 'to_myuser')
+        return _user_list_response(request, usernames, next_cursor)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@read_replica
+def get_user_following(request, username):
+    """Get a page of users the specified user follows"""
     try:
         user = get_object_or_404(MyUser, username=username)
-        followers = user.followers.all()
-        serializer = MyUserProfileSerializer(followers, many=True, context={'request': request})
-        return Response(serializer.data)
+        usernames = Follow.objects.filter(to_myuser=user).values_list('from_myuser', flat=True)
+        usernames, next_cursor = paginate_by_key(usernames, request, 'from_myuser')
+        return _user_list_response(request, usernames, next_cursor)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
+@read_replica
 def explore(request):
-    """Get posts for explore page (all recent posts)"""
+    """Get a page of the explore feed, best ranked first (see api/explore.py)"""
     try:
-        posts = Post.objects.all().order_by('-created_at')[:20]  # Limit to 20 recent posts
-        serializer = PostSerializer(posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        post_ids, next_cursor = explore_page(request)
+
+        not_modified, headers, states = posts_conditional(request, post_ids)
+        if not_modified:
+            return not_modified
+        return Response({'results': render_posts(post_ids, request, states), 'next_cursor': next_cursor}, headers=headers)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@read_replica
 def search_recipes(request):
-    """Search for recipes by title"""
+    """Search for recipes by title, ingredients, instructions and tags"""
     try:
         query = request.query_params.get('query', '')
         if not query:
-            return Response([])
+            return Response({'results': [], 'next_page': None})
         
-        # Search for posts where the caption contains the query
-        # Since recipe data is stored as JSON in the caption field,
-        # we need to filter posts that have a title containing the query
-        posts = Post.objects.all()
-        matching_posts = []
-        
-        for post in posts:
-            try:
-                # Try to parse the caption as JSON
-                recipe_data = json.loads(post.caption)
-                # Check if it has a title field and if the title contains the query
-                if 'title' in recipe_data and query.lower() in recipe_data['title'].lower():
-                    matching_posts.append(post)
-            except (json.JSONDecodeError, AttributeError):
-                # If the caption is not valid JSON or doesn't have a title field, skip it
-                continue
+        try:
+            page = max(1, int(request.query_params.get('page', 1)))
+        except ValueError:
+            page = 1
+        page_size = get_page_size(request, default=10, maximum=50)
         
-        # Limit to 10 results
-        matching_posts = matching_posts[:10]
+        # Ranked lookup in the recipe search index, one extra id tells us if there's another page
+        ids = search_recipe_ids(query, limit=page_size + 1, offset=(page - 1) * page_size)
+        next_page = page + 1 if len(ids) > page_size else None
+        ids = ids[:page_size]
         
-        serializer = PostSerializer(matching_posts, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response({'results': render_posts(ids, request), 'next_page': next_page})
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -205,9 +331,36 @@ def search_recipes(request):
 def get_current_user(request):
     """Get current logged-in user information"""
     try:
-        user = request.user
-        serializer = MyUserProfileSerializer(user, context={'request': request})
-        return Response(serializer.data)
+        # request.user only has the fields authentication needs loaded
+        return Response(render_profile(request.user.username, request))
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@read_replica
+def get_follow_state(request):
+    """Whether the current user follows each of the given usernames"""
+    try:
+        usernames = request.data.get('usernames')
+        if not isinstance(usernames, list) or not all(isinstance(u, str) for u in usernames):
+            return Response({'error': 'usernames must be a list of strings'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(usernames) > MAX_FOLLOW_STATE_USERNAMES:
+            return Response({'error': f'At most {MAX_FOLLOW_STATE_USERNAMES} usernames per request'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        following = followed_usernames(request.user, usernames)
+        return Response({username: username in following for username in usernames})
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch(request):
+    """Apply a list of likes, comments and follows in one transaction, see api/batch.py"""
+    try:
+        results = apply_batch(request.user, request.data.get('operations'))
+        return Response({'results': results})
+    except InvalidBatch as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
\ No newline at end of file
@@ -37,7 +37,7 @@ AUTH_USER_MODEL = 'api.MyUser'
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "api.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -49,6 +49,26 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Feed pagination (keyset, see api/pagination.py)
+FEED_PAGE_SIZE = int(os.getenv('FEED_PAGE_SIZE', 20))
+FEED_MAX_PAGE_SIZE = int(os.getenv('FEED_MAX_PAGE_SIZE', 100))
+
+# Comments embedded in each post payload; the rest are paged from posts/<id>/comments/
+COMMENT_PREVIEW_COUNT = int(os.getenv('COMMENT_PREVIEW_COUNT', 3))
+
+# Fan-out-on-write home timelines (see api/timeline.py). Authors with more
+# followers than the threshold are merged in at read time instead.
+TIMELINE_FANOUT = os.getenv('TIMELINE_FANOUT', 'False') == 'True'
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.getenv('TIMELINE_FANOUT_MAX_FOLLOWERS', 10000))
+TIMELINE_BACKFILL_POSTS = int(os.getenv('TIMELINE_BACKFILL_POSTS', 200))
+
+# Explore ranking (see api/explore.py). Run `python manage.py rank_explore`
+# every minute or so; after changing these, run it once with --full.
+EXPLORE_HALF_LIFE_HOURS = float(os.getenv('EXPLORE_HALF_LIFE_HOURS', 24))
+EXPLORE_COMMENT_WEIGHT = float(os.getenv('EXPLORE_COMMENT_WEIGHT', 2))
+EXPLORE_AUTHOR_PENALTY = float(os.getenv('EXPLORE_AUTHOR_PENALTY', 0.5))
+EXPLORE_WINDOW_DAYS = int(os.getenv('EXPLORE_WINDOW_DAYS', 14))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -56,6 +76,9 @@ SIMPLE_JWT = {
     'PAYLOAD_INCLUDE_USER_ID': True,
 }
 
+# How long api.authentication.CachedJWTAuthentication trusts a cached user
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', 300))
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
@@ -76,6 +99,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings include the other middleware; off unless PROFILING
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -110,12 +135,93 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE=postgres switches to PostgreSQL (needs `pip install "psycopg[binary,pool]"`),
+# configured from the DATABASE_* variables below. Otherwise SQLite is used, in
+# WAL mode with a busy timeout so readers don't block the writer.
+
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgres':
+    DATABASE_POOL = os.getenv('DATABASE_POOL', 'False') == 'True'
+
+    def postgres_database(host):
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DATABASE_NAME', 'tastebuds'),
+            'USER': os.getenv('DATABASE_USER', 'postgres'),
+            'PASSWORD': os.getenv('DATABASE_PASSWORD', ''),
+            'HOST': host,
+            'PORT': os.getenv('DATABASE_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+        if DATABASE_POOL:
+            # psycopg's pool replaces persistent connections
+            database['CONN_MAX_AGE'] = 0
+            database['OPTIONS']['pool'] = {
+                'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+            }
+        else:
+            database['CONN_MAX_AGE'] = int(os.getenv('DATABASE_CONN_MAX_AGE', 60))
+        return database
+
+    DATABASES = {
+        'default': postgres_database(os.getenv('DATABASE_HOST', 'localhost')),
     }
-}
+    # Comma separated hosts, read by views marked @read_replica (api/routers.py)
+    for i, host in enumerate(h for h in os.getenv('DATABASE_REPLICA_HOSTS', '').split(',') if h.strip()):
+        DATABASES[f'replica_{i}'] = postgres_database(host.strip())
+        DATABASES[f'replica_{i}']['TEST'] = {'MIRROR': 'default'}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                # Take the write lock at BEGIN so concurrent writers queue instead of deadlocking
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+            },
+            # A file rather than the default in-memory database, so threaded
+            # tests get the same locking as production: a shared in-memory
+            # database fails with "table is locked" instead of waiting
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+
+# Cache
+# Post and profile payloads are cached here (see api/cache.py). locmem is per
+# process; pick 'file' or 'redis' when running several workers.
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL', 'redis://127.0.0.1:6379'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_URL', BASE_DIR / 'cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+PAYLOAD_CACHE_TIMEOUT = int(os.getenv('PAYLOAD_CACHE_TIMEOUT', 60))
 
 
 # Password validation
@@ -139,13 +245,28 @@ AUTH_PASSWORD_VALIDATORS = [
 
 #   Password salt and hash
 
+# PASSWORD_HASHER picks the hasher for new passwords. The others stay listed
+# so existing hashes still verify; they are upgraded to the preferred hasher
+# and work factors on the user's next login. Time logins with
+# `python manage.py bench_login`.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'argon2')
+_PASSWORD_HASHERS = {
+    'argon2': 'api.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'api.hashers.PBKDF2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
 PASSWORD_HASHERS = [
-    'django.contrib.auth.hashers.PBKDF2PasswordHasher',       # Default and recommended
-    'django.contrib.auth.hashers.Argon2PasswordHasher',         # Alternative strong hasher
-    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',   # Another secure option
-    'django.contrib.auth.hashers.ScryptPasswordHasher',         # Yet another modern choice
+    _PASSWORD_HASHERS[PASSWORD_HASHER],
+    *(path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER),
 ]
 
+# Work factors, defaulting to Django's own
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', 102400))  # KiB
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', 8))
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', 1_000_000))
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -167,6 +288,49 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploaded post images are re-encoded into these variants (longest side in px)
+POST_IMAGE_VARIANTS = {
+    'thumb': 320,
+    'feed': 1080,
+    'full': 2048,
+}
+POST_IMAGE_FORMAT = os.getenv('POST_IMAGE_FORMAT', 'WEBP')
+POST_IMAGE_QUALITY = int(os.getenv('POST_IMAGE_QUALITY', 80))
+
+# 'inline' processes uploads inside create_post. 'queue' hands them to
+# `manage.py process_images` (api/jobs.py), which must be running or new
+# posts stay pending
+IMAGE_PROCESSING = os.getenv('IMAGE_PROCESSING', 'inline')
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv('IMAGE_JOB_MAX_ATTEMPTS', 3))
+IMAGE_JOB_TIMEOUT = int(os.getenv('IMAGE_JOB_TIMEOUT', 300))
+
+# With LIKE_FLUSH_INTERVAL > 0, PUT/DELETE likes are buffered in each process
+# and written every LIKE_FLUSH_INTERVAL seconds, or sooner once
+# LIKE_FLUSH_MAX_PENDING are waiting (see api/likes.py). Buffered likes are
+# acknowledged with a 202 before they're written and are lost if the process
+# dies first, so this is opt-in. 0 writes each one straight away.
+LIKE_FLUSH_INTERVAL = float(os.getenv('LIKE_FLUSH_INTERVAL', 0))
+LIKE_FLUSH_MAX_PENDING = int(os.getenv('LIKE_FLUSH_MAX_PENDING', 1000))
+
+# Live events (see api/events.py), streamed from /api/events/ under ASGI.
+# 'local' only reaches clients connected to the same process; use 'redis'
+# with several workers, or '' to turn publishing off.
+EVENT_BROKER = os.getenv('EVENT_BROKER', 'local')
+EVENT_BROKER_URL = os.getenv('EVENT_BROKER_URL', 'redis://127.0.0.1:6379')
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 100))
+EVENT_STREAM_HEARTBEAT = int(os.getenv('EVENT_STREAM_HEARTBEAT', 15))
+# Streams end after this many seconds and the client reconnects, so an
+# expired token doesn't keep a stream open forever
+EVENT_STREAM_MAX_AGE = int(os.getenv('EVENT_STREAM_MAX_AGE', 600))
+
+# Per-view latency, query and response size histograms at /metrics (see
+# api/profiling.py). With PROFILING_SLOW_REQUEST_MS > 0, requests taking at
+# least that long are logged with their SQL. Set METRICS_TOKEN to require
+# "Authorization: Bearer <token>" on /metrics.
+PROFILING = os.getenv('PROFILING', 'False') == 'True'
+PROFILING_SLOW_REQUEST_MS = int(os.getenv('PROFILING_SLOW_REQUEST_MS', 0))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
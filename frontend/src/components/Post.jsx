@@ -5,6 +5,7 @@ import { Link } from 'react-router-dom';
 import axios from 'axios';
 import { API_URL } from '../constants';
 import { jwtDecode } from 'jwt-decode';
+import { subscribeToEvents } from '../events';
 
 const Post = ({ post, refreshPosts }) => {
   const [comment, setComment] = useState('');
@@ -14,6 +15,7 @@ const Post = ({ post, refreshPosts }) => {
   const [likesCount, setLikesCount] = useState(post.likes_count);
   const [comments, setComments] = useState(post.comments || []);
   const [commentsCount, setCommentsCount] = useState(post.comments_count || 0);
+  const [commentsCursor, setCommentsCursor] = useState(null);
   const [currentUsername, setCurrentUsername] = useState('');
   
   // Number of preview comments to show
@@ -56,6 +58,25 @@ const Post = ({ post, refreshPosts }) => {
     fetchCurrentUsername();
   }, []);
   
+  // Apply other people's likes and comments as they happen; our own are
+  // already shown optimistically
+  useEffect(() => {
+    return subscribeToEvents((event) => {
+      if (event.post_id !== post.id || !['like', 'comment'].includes(event.type)) return;
+      const ownUsername = localStorage.getItem('username');
+      const actor = event.type === 'like' ? event.username : event.comment.username;
+      if (actor === ownUsername) return;
+
+      setLikesCount(event.likes_count);
+      setCommentsCount(event.comments_count);
+      if (event.type === 'comment') {
+        setComments(prevComments =>
+          prevComments.some(c => c.id === event.comment.id) ? prevComments : [...prevComments, event.comment]
+        );
+      }
+    });
+  }, [post.id]);
+
   // Get the comments to display based on whether showing all or just preview
   const commentsToDisplay = showAllComments ? comments : comments.slice(-PREVIEW_COMMENTS_COUNT);
   
@@ -88,15 +109,15 @@ const Post = ({ post, refreshPosts }) => {
     try {
       console.log('Attempting to like post with ID:', post.id);
       const token = localStorage.getItem('access_token');
-      await axios.post(
-        `${API_URL}/api/posts/${post.id}/like/`,
-        {},
-        {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        }
-      );
+      // PUT likes, DELETE unlikes: sending the state we want (not a toggle)
+      // keeps quick repeated taps from getting out of sync with the server
+      await axios({
+        method: newIsLiked ? 'put' : 'delete',
+        url: `${API_URL}/api/posts/${post.id}/like/`,
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
       console.log('Successfully liked/unliked post');
       // We don't need to call refreshPosts() here as we've already updated the UI
     } catch (error) {
@@ -162,8 +183,30 @@ const Post = ({ post, refreshPosts }) => {
     }
   };
 
+  // Posts only carry the latest few comments, older ones are paged in from the API
+  const fetchComments = async (cursor = null) => {
+    try {
+      const token = localStorage.getItem('access_token');
+      const response = await axios.get(`${API_URL}/api/posts/${post.id}/comments/`, {
+        params: cursor ? { cursor } : {},
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      // Pages come newest first, the list is shown oldest first
+      const page = [...response.data.results].reverse();
+      setComments(prevComments => (cursor ? [...page, ...prevComments] : page));
+      setCommentsCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching comments:', error);
+    }
+  };
+
   const handleCommentClick = (e) => {
     e.preventDefault();
+    if (!showAllComments && comments.length < commentsCount) {
+      fetchComments();
+    }
     setShowAllComments(!showAllComments);
   };
 
@@ -182,7 +225,7 @@ const Post = ({ post, refreshPosts }) => {
       {/* Post Image */}
       <Box position="relative" paddingBottom="56.25%" maxHeight="600px">
         <Image 
-          src={post.image} 
+          src={post.image_srcset?.feed || post.image} 
           alt="Recipe" 
           position="absolute"
           top="0"
@@ -345,6 +388,19 @@ const Post = ({ post, refreshPosts }) => {
             </Text>
           )}
           
+          {showAllComments && commentsCursor && (
+            <Text 
+              color="gray.500" 
+              mb={2} 
+              fontWeight="medium" 
+              cursor="pointer" 
+              onClick={() => fetchComments(commentsCursor)}
+              _hover={{ color: "blue.500" }}
+            >
+              Load earlier comments
+            </Text>
+          )}
+
           {/* Only show when expanded AND we have more than preview amount */}
           {showAllComments && commentsCount > PREVIEW_COMMENTS_COUNT && (
             <Text 
@@ -0,0 +1,73 @@
+import { API_URL, ACCESS_TOKEN } from './constants';
+
+// One shared connection to the server's live event stream (/api/events/).
+// EventSource can't send the Authorization header, so the stream is read with
+// fetch. Listeners get each event object; after a reconnect they get
+// { type: 'resync' } since events may have been missed in between.
+
+const listeners = new Set();
+let controller = null;
+
+const dispatch = (event) => {
+  listeners.forEach((listener) => listener(event));
+};
+
+const connect = async () => {
+  let retryDelay = 1000;
+  let reconnected = false;
+  controller = new AbortController();
+  const { signal } = controller;
+
+  while (!signal.aborted) {
+    try {
+      const response = await fetch(`${API_URL}/api/events/`, {
+        headers: { Authorization: `Bearer ${localStorage.getItem(ACCESS_TOKEN)}` },
+        signal,
+      });
+      if (!response.ok) {
+        throw new Error(`Event stream returned ${response.status}`);
+      }
+      if (reconnected) {
+        dispatch({ type: 'resync' });
+      }
+      retryDelay = 1000;
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += value;
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+        frames.forEach((frame) => {
+          if (frame.startsWith('data: ')) {
+            dispatch(JSON.parse(frame.slice(6)));
+          }
+        });
+      }
+    } catch (error) {
+      if (signal.aborted) return;
+      console.error('Event stream error:', error);
+      retryDelay = Math.min(retryDelay * 2, 30000);
+    }
+    reconnected = true;
+    await new Promise((resolve) => setTimeout(resolve, retryDelay));
+  }
+};
+
+// Register `listener` for live events; returns a function that removes it.
+// The stream stays open while anyone is listening.
+export const subscribeToEvents = (listener) => {
+  listeners.add(listener);
+  if (!controller) {
+    connect();
+  }
+  return () => {
+    listeners.delete(listener);
+    if (listeners.size === 0 && controller) {
+      controller.abort();
+      controller = null;
+    }
+  };
+};
@@ -17,7 +17,8 @@ import {
   VStack,
   useColorModeValue,
   Container,
-  Icon
+  Icon,
+  Button
 } from '@chakra-ui/react';
 import axios from 'axios';
 import { API_URL } from '../constants';
@@ -27,6 +28,8 @@ import { GiCook } from 'react-icons/gi';
 const Explore = () => {
   const [posts, setPosts] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedPost, setSelectedPost] = useState(null);
   const { isOpen, onOpen, onClose } = useDisclosure();
   
@@ -53,7 +56,8 @@ const Explore = () => {
           Authorization: `Bearer ${token}`,
         },
       });
-      setPosts(response.data);
+      setPosts(response.data.results);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error fetching explore recipes:', error);
     } finally {
@@ -61,6 +65,26 @@ const Explore = () => {
     }
   };
 
+  const fetchMoreExplorePosts = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const token = localStorage.getItem('access_token');
+      const response = await axios.get(`${API_URL}/api/explore/`, {
+        params: { cursor: nextCursor },
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      setPosts((prev) => [...prev, ...response.data.results]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching more explore recipes:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const openPostModal = (post) => {
     setSelectedPost(post);
     onOpen();
@@ -116,7 +140,7 @@ const Explore = () => {
                   }}
                 >
                   <Image 
-                    src={post.image} 
+                    src={post.image_srcset?.thumb || post.image} 
                     alt={recipeData.title} 
                     position="absolute"
                     top="0"
@@ -162,6 +186,20 @@ const Explore = () => {
         </Box>
       )}
       
+      {nextCursor && (
+        <Flex justify="center" mt={8}>
+          <Button
+            onClick={fetchMoreExplorePosts}
+            isLoading={loadingMore}
+            colorScheme="green"
+            variant="outline"
+            borderRadius="xl"
+          >
+            Load more
+          </Button>
+        </Flex>
+      )}
+      
       {/* Recipe Modal */}
       <Modal isOpen={isOpen} onClose={onClose} size="2xl" isCentered>
         <ModalOverlay bg="blackAlpha.700" />
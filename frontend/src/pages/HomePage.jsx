@@ -3,6 +3,7 @@ import { Box, VStack, Heading, Button, Flex, Spinner, Text, Icon } from '@chakra
 import axios from 'axios';
 import { API_URL } from '../constants';
 import Post from '../components/Post';
+import { subscribeToEvents } from '../events';
 import { Link } from 'react-router-dom';
 import { GiCook } from "react-icons/gi";
 import { IoAddCircle } from "react-icons/io5";
@@ -11,6 +12,9 @@ const HomePage = () => {
   const [posts, setPosts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [newPostsCount, setNewPostsCount] = useState(0);
 
   const fetchPosts = async () => {
     try {
@@ -21,7 +25,9 @@ const HomePage = () => {
           Authorization: `Bearer ${token}`,
         },
       });
-      setPosts(response.data);
+      setPosts(response.data.results);
+      setNextCursor(response.data.next_cursor);
+      setNewPostsCount(0);
       setError(null);
     } catch (error) {
       console.error('Error fetching posts:', error);
@@ -31,10 +37,41 @@ const HomePage = () => {
     }
   };
 
+  const fetchMorePosts = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const token = localStorage.getItem('access_token');
+      const response = await axios.get(`${API_URL}/api/feed/`, {
+        params: { cursor: nextCursor },
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      setPosts((prev) => [...prev, ...response.data.results]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching more posts:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchPosts();
   }, []);
 
+  // New posts are announced rather than inserted, so the feed doesn't jump
+  useEffect(() => {
+    return subscribeToEvents((event) => {
+      if (event.type === 'post' && event.username !== localStorage.getItem('username')) {
+        setNewPostsCount((count) => count + 1);
+      } else if (event.type === 'resync') {
+        fetchPosts();
+      }
+    });
+  }, []);
+
   return (
     <Box maxW="800px" mx="auto" py={8} px={4}>
       <Flex 
@@ -144,9 +181,25 @@ const HomePage = () => {
         </Box>
       ) : (
         <VStack spacing={6} align="stretch">
+          {newPostsCount > 0 && (
+            <Button onClick={fetchPosts} colorScheme="green" borderRadius="xl">
+              {newPostsCount} new {newPostsCount === 1 ? 'recipe' : 'recipes'}
+            </Button>
+          )}
           {posts.map((post) => (
             <Post key={post.id} post={post} refreshPosts={fetchPosts} />
           ))}
+          {nextCursor && (
+            <Button
+              onClick={fetchMorePosts}
+              isLoading={loadingMore}
+              colorScheme="green"
+              variant="outline"
+              borderRadius="xl"
+            >
+              Load more
+            </Button>
+          )}
         </VStack>
       )}
     </Box>
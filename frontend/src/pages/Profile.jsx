@@ -59,6 +59,8 @@ const Profile = () => {
   const [isErrorModalOpen, setIsErrorModalOpen] = useState(false);
   const [followers, setFollowers] = useState([]);
   const [loadingFollowers, setLoadingFollowers] = useState(false);
+  const [followersCursor, setFollowersCursor] = useState(null);
+  const [loadingMoreFollowers, setLoadingMoreFollowers] = useState(false);
   const {
     isOpen: isFollowersOpen,
     onOpen: onFollowersOpen,
@@ -179,42 +181,62 @@ const Profile = () => {
     }
   };
 
+  // One page of followers; pass the previous page's next_cursor for the next one
+  const fetchFollowerPage = async (cursor) => {
+    const token = localStorage.getItem(ACCESS_TOKEN);
+    if (!token) {
+      throw new Error("No auth token available");
+    }
+    
+    const response = await axios.get(`${API_URL}/api/user/${profileUsername}/followers/`, {
+      headers: {
+        Authorization: `Bearer ${token}`,
+      },
+      params: cursor ? { cursor } : {},
+    });
+    setFollowersCursor(response.data.next_cursor);
+    return response.data.results;
+  };
+
+  const showFollowersError = (error) => {
+    console.error('Error fetching followers:', error);
+    
+    toast({
+      title: 'Error',
+      description: 'Failed to load followers: ' + (error.response?.data?.error || error.message),
+      status: 'error',
+      duration: 3000,
+      isClosable: true,
+    });
+  };
+
   const fetchFollowers = async () => {
     try {
-      console.log("Followers clicked - opening modal and fetching data");
       setLoadingFollowers(true);
       setFollowers([]); // Reset followers state
+      setFollowersCursor(null);
       onFollowersOpen(); // Open modal immediately to show loading state
       
-      console.log("Fetching followers for:", profileUsername);
-      const token = localStorage.getItem(ACCESS_TOKEN);
-      if (!token) {
-        throw new Error("No auth token available");
-      }
-      
-      const response = await axios.get(`${API_URL}/api/user/${profileUsername}/followers/`, {
-        headers: {
-          Authorization: `Bearer ${token}`,
-        },
-      });
-      
-      console.log("Followers received:", response.data);
-      setFollowers(response.data);
+      setFollowers(await fetchFollowerPage(null));
     } catch (error) {
-      console.error('Error fetching followers:', error);
-      
-      toast({
-        title: 'Error',
-        description: 'Failed to load followers: ' + (error.response?.data?.error || error.message),
-        status: 'error',
-        duration: 3000,
-        isClosable: true,
-      });
+      showFollowersError(error);
     } finally {
       setLoadingFollowers(false);
     }
   };
 
+  const loadMoreFollowers = async () => {
+    try {
+      setLoadingMoreFollowers(true);
+      const more = await fetchFollowerPage(followersCursor);
+      setFollowers(current => [...current, ...more]);
+    } catch (error) {
+      showFollowersError(error);
+    } finally {
+      setLoadingMoreFollowers(false);
+    }
+  };
+
   const handleFollow = async () => {
     try {
       // Prevent following yourself
@@ -585,7 +607,7 @@ const Profile = () => {
                         }}
                       >
                         <Image 
-                          src={post.image} 
+                          src={post.image_srcset?.thumb || post.image} 
                           alt={recipeData.title} 
                           position="absolute"
                           top="0"
@@ -714,38 +736,48 @@ const Profile = () => {
                 <Spinner size="lg" color="#7ac142" thickness="4px" />
               </Center>
             ) : followers.length > 0 ? (
-              <List spacing={3}>
-                {followers.map(follower => (
-                  <ListItem key={follower.username} py={2}>
-                    <Flex align="center" 
-                      onClick={() => {
-                        onFollowersClose();
-                        navigate(`/profile/${follower.username}`);
-                      }} 
-                      cursor="pointer"
-                      p={2}
-                      borderRadius="md"
-                      _hover={{ bg: "gray.50" }}
-                      transition="all 0.2s"
-                    >
-                      <Avatar 
-                        size="md" 
-                        name={follower.username} 
-                        src={follower.profile_image}
-                        mr={3}
-                        bg="#7ac142"
-                        icon={<Icon as={GiCook} color="white" />}
-                      />
-                      <Box>
+              <>
+                <List spacing={3}>
+                  {followers.map(follower => (
+                    <ListItem key={follower.username} py={2}>
+                      <Flex align="center" 
+                        onClick={() => {
+                          onFollowersClose();
+                          navigate(`/profile/${follower.username}`);
+                        }} 
+                        cursor="pointer"
+                        p={2}
+                        borderRadius="md"
+                        _hover={{ bg: "gray.50" }}
+                        transition="all 0.2s"
+                      >
+                        <Avatar 
+                          size="md" 
+                          name={follower.username} 
+                          src={follower.profile_image}
+                          mr={3}
+                          bg="#7ac142"
+                          icon={<Icon as={GiCook} color="white" />}
+                        />
                         <Text fontWeight="bold">{follower.username}</Text>
-                        <Text fontSize="sm" color="gray.500" noOfLines={1}>
-                          {follower.bio || "TasteBuds User"}
-                        </Text>
-                      </Box>
-                    </Flex>
-                  </ListItem>
-                ))}
-              </List>
+                      </Flex>
+                    </ListItem>
+                  ))}
+                </List>
+                {followersCursor && (
+                  <Center pt={4}>
+                    <Button
+                      size="sm"
+                      variant="outline"
+                      colorScheme="green"
+                      onClick={loadMoreFollowers}
+                      isLoading={loadingMoreFollowers}
+                    >
+                      Load more
+                    </Button>
+                  </Center>
+                )}
+              </>
             ) : (
               <Center flexDirection="column" py={8}>
                 <Icon as={FaUserFriends} boxSize="3rem" color="#7ac142" mb={4} />
@@ -68,8 +68,8 @@ function Search() {
         })
       ]);
       
-      setUsers(usersResponse.data);
-      setRecipes(recipesResponse.data);
+      setUsers(usersResponse.data.results);
+      setRecipes(recipesResponse.data.results);
     } catch (error) {
       console.error('Error during search:', error);
       toast({
@@ -183,7 +183,7 @@ function Search() {
                         >
                           <Box position="relative" height="150px">
                             <Image 
-                              src={recipe.image} 
+                              src={recipe.image_srcset?.thumb || recipe.image} 
                               alt={recipeData.title} 
                               objectFit="cover"
                               width="100%"